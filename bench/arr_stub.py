@@ -0,0 +1,77 @@
+"""
+Local stand-in for the Sonarr/Radarr API calls ArrNotifier makes: records the import commands and the grabs that
+were marked as failed. Grabs are registered with grab(), like the *arr does when it drops an nzb into the blackhole.
+
+Point the manager at it with:  ARR_INSTANCES=tv=sonarr@http://127.0.0.1:<port>?apikey=arr-key
+"""
+
+import logging
+import threading
+import time
+from collections import Counter
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+
+class ArrStub:
+    def __init__(self, api_key: str = "arr-key", api_version: str = "v3"):
+        self.api_key = api_key
+        self.api_version = api_version
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.history = []  # grabbed events, newest last
+        self.commands = []
+        self.failed = []
+        self.base_url = None
+        self._server = None
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        self._server = make_server(host, port, create_app(self), threaded=True)
+        self.base_url = f"http://{host}:{self._server.server_port}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+
+    def grab(self, source_title: str):
+        with self.lock:
+            self.history.append({"id": len(self.history) + 1, "sourceTitle": source_title, "eventType": "grabbed"})
+
+
+def create_app(stub: ArrStub) -> Flask:
+    app = Flask(__name__)
+    prefix = f"/api/{stub.api_version}"
+
+    @app.before_request
+    def check_key():
+        stub.calls[request.path[len(prefix) :].split("/failed/")[0]] += 1
+        if request.headers.get("X-Api-Key") != stub.api_key:
+            return jsonify({"error": "Unauthorized"}), 401
+        return None
+
+    @app.route(f"{prefix}/command", methods=["POST"])
+    def command():
+        with stub.lock:
+            stub.commands.append({**request.get_json(), "received": time.time()})
+            c_id = len(stub.commands)
+        return jsonify({"id": c_id, "name": request.get_json()["name"], "status": "queued"}), 201
+
+    @app.route(f"{prefix}/history")
+    def history():
+        size = int(request.args.get("pageSize", 10))
+        with stub.lock:
+            records = list(reversed(stub.history))[:size]
+        return jsonify({"page": 1, "pageSize": size, "totalRecords": len(stub.history), "records": records})
+
+    @app.route(f"{prefix}/history/failed/<int:history_id>", methods=["POST"])
+    def history_failed(history_id):
+        with stub.lock:
+            if not any(record["id"] == history_id for record in stub.history):
+                return jsonify({"message": "Not found"}), 404
+            stub.failed.append(history_id)
+        return "", 200
+
+    return app
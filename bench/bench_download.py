@@ -0,0 +1,127 @@
+"""
+Compares the download backends (pySmartDL vs. the native segmented engine) against a local HTTP server.
+
+The server supports range requests and can throttle every connection (like many CDNs do), which is where
+segmenting pays off. Reports wall time, throughput and the bytes the process wrote (wchar from /proc/self/io),
+pySmartDL writes every byte twice (segment files + merge).
+
+    python bench/bench_download.py --size-mb 512 --per-connection-mbps 40 --threads 4
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from flask import Flask, Response, request
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def create_file_server(path: str, per_connection_bps: float = None) -> Flask:
+    app = Flask(__name__)
+    size = os.path.getsize(path)
+
+    @app.route("/file/<name>")
+    def serve(name):  # pylint: disable=unused-argument # pySmartDL takes the file name from the url
+        start, end, status = 0, size - 1, 200
+        match = re.match(r"bytes=(\d+)-(\d*)", request.headers.get("Range", ""))
+        if match:
+            start, status = int(match.group(1)), 206
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+
+        def generate():
+            sent, began = 0, time.monotonic()
+            with open(path, "rb") as f:
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = f.read(min(256 * 1024, remaining))
+                    remaining -= len(chunk)
+                    sent += len(chunk)
+                    yield chunk
+                    if per_connection_bps:
+                        ahead = sent / per_connection_bps - (time.monotonic() - began)
+                        if ahead > 0:
+                            time.sleep(ahead)
+
+        headers = {"Content-Length": str(end - start + 1), "Accept-Ranges": "bytes"}
+        if status == 206:
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return Response(generate(), status=status, headers=headers, mimetype="application/octet-stream")
+
+    return app
+
+
+def process_write_bytes():
+    try:
+        with open("/proc/self/io", encoding="utf-8") as f:
+            return int(re.search(r"wchar: (\d+)", f.read()).group(1))
+    except (OSError, AttributeError):
+        return None
+
+
+def sha256_of(path: str):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--threads", type=int, default=4, help="DOWNLOAD_THREADS / max connections")
+    parser.add_argument("--per-connection-mbps", type=float, default=0, help="server side limit per connection")
+    parser.add_argument("--backends", default="pysmartdl,native")
+    parser.add_argument("--runs", type=int, default=1)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="premiumarr-dl-bench-")
+    os.environ.setdefault("CONFIG_PATH", work_dir)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    from src.downloader import Downloader  # pylint: disable=import-outside-toplevel
+
+    source = f"{work_dir}/source.bin"
+    with open(source, "wb") as f:
+        for _ in range(args.size_mb):
+            f.write(os.urandom(1024 * 1024))
+    expected_hash = sha256_of(source)
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    limit = args.per_connection_mbps * 1024**2 / 8 if args.per_connection_mbps else None
+    server = make_server("127.0.0.1", 0, create_file_server(source, limit), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/file/bench.bin"
+
+    print(f"file: {args.size_mb} MB, threads: {args.threads}, per connection limit: {args.per_connection_mbps} Mbit/s")
+    for backend in args.backends.split(","):
+        for run in range(args.runs):
+            dest = f"{work_dir}/{backend}-{run}"
+            downloader = Downloader(dest, args.threads, None, backend=backend)
+            written_before, started = process_write_bytes(), time.monotonic()
+            downloader.download(url, "bench.bin", size=args.size_mb * 1024**2)
+            elapsed = time.monotonic() - started
+            written = process_write_bytes() - written_before if written_before is not None else None
+
+            ok = sha256_of(f"{dest}/bench.bin") == expected_hash
+            written_str = f"{written / 1024**2:.0f} MB written ({written / (args.size_mb * 1024**2):.2f}x)"
+            print(
+                f"{backend:>10} run {run}: {elapsed:6.2f}s  {args.size_mb / elapsed:7.1f} MB/s  "
+                f"{written_str if written is not None else 'n/a'}  content ok: {ok}"
+            )
+            shutil.rmtree(dest)
+
+    server.shutdown()
+    shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
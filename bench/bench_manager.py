@@ -0,0 +1,225 @@
+"""
+End-to-end throughput benchmark for the Manager against the local premiumize stub.
+
+Feeds N NZBs into a temporary blackhole, runs the real Manager loop until every item is 'done' or 'failed' and
+reports items/hour, how long items spend in every state, how long every stage of the loop takes and API call counts.
+
+    python bench/bench_manager.py --items 20 --latency-ms 50 --transfer-seconds 3 --file-size-kb 4096
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.premiumize_stub import (  # noqa: E402 # pylint: disable=wrong-import-position
+    PremiumizeStub,
+    StubConfig,
+    add_config_arguments,
+)
+from bench.arr_stub import ArrStub  # noqa: E402 # pylint: disable=wrong-import-position
+
+STAGES = [
+    "check_folder_for_incoming_nzbs",
+    "upload_nzbs_to_premiumize_downloader",
+    "check_premiumize_downloader_state",
+    "download_files_from_premiumize",
+    "cleanup_online_files",
+    "move_to_done",
+]
+NZB_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE nzb PUBLIC "-//newzBin//DTD NZB 1.1//EN" "http://www.newzbin.com/DTD/nzb/nzb-1.1.dtd">
+<nzb xmlns="http://www.newzbin.com/DTD/2003/nzb">
+  <file poster="bench@premiumarr" date="{date}" subject="bench item {idx} - &quot;{name}.mkv&quot; yEnc (1/{segments})">
+    <groups><group>alt.binaries.bench</group></groups>
+    <segments>
+{segment_lines}
+    </segments>
+  </file>
+</nzb>
+"""
+
+
+def write_nzbs(blackhole: str, count: int, category: str, segments: int) -> list[str]:
+    os.makedirs(f"{blackhole}/{category}", exist_ok=True)
+    paths = []
+    for idx in range(count):
+        name = f"Bench.Show.S01E{idx:03d}.1080p.WEB.x264-PREMIUMARR"
+        segment_lines = "\n".join(
+            f'      <segment bytes="768000" number="{n}">{idx}.{n}.bench@premiumarr</segment>'
+            for n in range(1, segments + 1)
+        )
+        path = f"{blackhole}/{category}/{name}.nzb"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(
+                NZB_TEMPLATE.format(
+                    date=int(time.time()), idx=idx, name=name, segments=segments, segment_lines=segment_lines
+                )
+            )
+        paths.append(path)
+    return paths
+
+
+def time_stages(manager, stage_times: dict):
+    """Wraps the stage methods of the manager instance so every call is timed"""
+    for stage in STAGES:
+        original = getattr(manager, stage)
+
+        def timed(*args, _original=original, _stage=stage, **kwargs):
+            start = time.perf_counter()
+            try:
+                return _original(*args, **kwargs)
+            finally:
+                stage_times[_stage].append(time.perf_counter() - start)
+
+        setattr(manager, stage, wraps(original)(timed))
+
+
+def watch_states(db_path: str, expected: int, timeout: float, poll: float = 0.05) -> tuple[dict, bool]:
+    """Polls the DB and records when each item was first seen in each state: {id: [(state, t), ...]}"""
+    seen = defaultdict(list)
+    deadline = time.monotonic() + timeout
+    conn = None
+    while time.monotonic() < deadline:
+        if conn is None and os.path.exists(db_path):
+            conn = sqlite3.connect(db_path, timeout=5)
+        if conn is not None:
+            try:
+                rows = conn.execute("SELECT id, state FROM data").fetchall()
+            except sqlite3.OperationalError:  # table not created yet / db locked
+                rows = []
+            now = time.monotonic()
+            for d_id, state in rows:
+                if not seen[d_id] or seen[d_id][-1][0] != state:
+                    seen[d_id].append((state, now))
+            finished = [d_id for d_id, states in seen.items() if states[-1][0] in ["done", "failed"]]
+            if len(finished) >= expected:
+                return seen, True
+        time.sleep(poll)
+    return seen, False
+
+
+def summarize(values: list[float]) -> dict:
+    if not values:
+        return {}
+    values = sorted(values)
+    return {
+        "n": len(values),
+        "mean": round(statistics.fmean(values), 4),
+        "p50": round(values[len(values) // 2], 4),
+        "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 4),
+        "max": round(values[-1], 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=10, help="number of NZBs to feed into the blackhole")
+    parser.add_argument("--category", default="tv", help="blackhole sub folder the NZBs are put into")
+    parser.add_argument("--nzb-segments", type=int, default=200, help="segments per NZB (controls the NZB size)")
+    parser.add_argument("--chk-delay", type=float, default=1, help="manager cycle delay (RECHECK_..._DELAY)")
+    parser.add_argument("--dl-threads", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=600, help="give up after this many seconds")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--arr", action="store_true", help="notify a local sonarr stub about done/failed items")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="premiumarr-bench-")
+    paths = {name: f"{work_dir}/{name}" for name in ["blackhole", "downloads", "done", "config"]}
+    for path in paths.values():
+        os.makedirs(path, exist_ok=True)
+    os.makedirs(f"{paths['config']}/archive", exist_ok=True)
+    os.makedirs(f"{paths['done']}/{args.category}", exist_ok=True)  # the *arr owns the category folder in done
+
+    stub = PremiumizeStub(StubConfig(**{k: v for k, v in vars(args).items() if k in vars(StubConfig())}))
+    os.environ["PREMIUMIZE_API_URL"] = stub.start()
+    os.environ["CONFIG_PATH"] = paths["config"]
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    arr = ArrStub() if args.arr else None
+    if arr:
+        os.environ["ARR_INSTANCES"] = f"{args.category}=sonarr@{arr.start()}?apikey={arr.api_key}"
+
+    # imported late so the env above is picked up by the module level config
+    from src.manager import Manager  # pylint: disable=import-outside-toplevel
+
+    for nzb in write_nzbs(paths["blackhole"], args.items, args.category, args.nzb_segments):
+        if arr:
+            arr.grab(os.path.basename(nzb).removesuffix(".nzb"))
+    stage_times = defaultdict(list)
+    manager_paths = (paths["blackhole"], paths["downloads"], paths["done"], paths["config"])
+
+    start = time.monotonic()
+    manager = Manager(stub.config.api_key, manager_paths, args.dl_threads, -1, args.chk_delay)
+    init_seconds = time.monotonic() - start
+    time_stages(manager, stage_times)
+    threading.Thread(target=manager.run, daemon=True).start()
+
+    seen, completed = watch_states(f"{paths['config']}/data.db", args.items, args.timeout)
+    elapsed = time.monotonic() - start
+
+    state_durations = defaultdict(list)
+    end_to_end, done, failed = [], 0, 0
+    for states in seen.values():
+        for (state, t_start), (_, t_end) in zip(states, states[1:]):
+            state_durations[state].append(t_end - t_start)
+        if states[-1][0] in ["done", "failed"]:
+            end_to_end.append(states[-1][1] - states[0][1])
+            done += states[-1][0] == "done"
+            failed += states[-1][0] == "failed"
+
+    report = {
+        "completed": completed,
+        "items": args.items,
+        "done": done,
+        "failed": failed,
+        "elapsed_s": round(elapsed, 2),
+        "manager_init_s": round(init_seconds, 3),
+        "items_per_hour": round(done / elapsed * 3600, 1) if elapsed else 0,
+        "end_to_end_s": summarize(end_to_end),
+        "time_in_state_s": {state: summarize(v) for state, v in state_durations.items()},
+        "stage_call_s": {stage: summarize(stage_times[stage]) for stage in STAGES},
+        "api_calls": dict(sorted(stub.calls.items())),
+        "cloud_left": {  # what the cleanup stage left behind in the stub cloud
+            "transfers": sum(len(acc.transfers) for acc in stub.accounts.values()),
+            "files": sum(len(acc.files) for acc in stub.accounts.values()),
+        },
+        "arr": {"commands": len(arr.commands), "failed_reported": len(arr.failed)} if arr else None,
+        "work_dir": work_dir,
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"\n{'=' * 30} PremiumArr benchmark {'=' * 30}")
+        print(f"items: {done} done / {failed} failed / {args.items} total  (completed: {completed})")
+        print(f"elapsed: {report['elapsed_s']}s  ->  {report['items_per_hour']} items/hour")
+        print(f"manager init: {report['manager_init_s']}s  end-to-end per item: {report['end_to_end_s']}")
+        print("time spent in state (s):")
+        for state, stats in report["time_in_state_s"].items():
+            print(f"  {state:<35} {stats}")
+        print("stage call duration (s):")
+        for stage, stats in report["stage_call_s"].items():
+            print(f"  {stage:<35} {stats}")
+        print("API calls:")
+        for endpoint, count in report["api_calls"].items():
+            print(f"  {endpoint:<35} {count}")
+        print(f"left in the cloud: {report['cloud_left']}")
+        if arr:
+            print(f"*arr: {len(arr.commands)} import command(s), {len(arr.failed)} failed grab(s) reported")
+        print(f"work dir: {work_dir}")
+    stub.stop()
+    sys.exit(0 if completed else 1)
+
+
+if __name__ == "__main__":
+    main()
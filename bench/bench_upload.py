@@ -0,0 +1,113 @@
+"""
+Peak memory of NZB uploads against the local premiumize stub: requests' files= (builds the whole multipart body in
+memory) vs. the streamed multipart body of PremiumizeAPI.upload_nzb, with and without on-the-fly gzip.
+
+Every mode runs in a fresh process that uploads --concurrent NZBs of --size-mb at the same time. The RSS of that
+process (VmRSS, sampled by a thread) before the uploads is compared to its peak during them. ru_maxrss can't be used:
+a spawned child starts with the high-water mark of the parent, which hosts the stub and grows while it runs.
+
+    python bench/bench_upload.py --size-mb 40 --concurrent 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.premiumize_stub import PremiumizeStub, StubConfig  # noqa: E402 # pylint: disable=wrong-import-position
+from bench.bench_manager import write_nzbs  # noqa: E402 # pylint: disable=wrong-import-position
+
+MODES = ["files", "stream", "stream-gzip"]
+SEGMENT_LINE_BYTES = 90  # roughly, one <segment> line of write_nzbs
+SAMPLE_INTERVAL_S = 0.005
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status", encoding="ascii") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024  # kB
+    raise RuntimeError("No VmRSS in /proc/self/status (Linux only)")
+
+
+class RssSampler:
+    """Keeps the highest RSS of the process while the with block runs"""
+
+    def __init__(self):
+        self.peak = rss_mb()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self.done.wait(SAMPLE_INTERVAL_S):
+            self.peak = max(self.peak, rss_mb())
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.done.set()
+        self.thread.join()
+        self.peak = max(self.peak, rss_mb())
+
+
+def upload(api_url: str, mode: str, paths: list[str], warmup: str, results):
+    os.environ["PREMIUMIZE_API_URL"] = api_url
+    os.environ["LOG_LEVEL"] = "WARNING"
+    os.environ["UPLOAD_COMPRESSION"] = "gzip" if mode == "stream-gzip" else "none"
+    from src.premiumize_api import PremiumizeAPI  # pylint: disable=import-outside-toplevel
+
+    api = PremiumizeAPI("stub-key")
+
+    def send(path):
+        if mode != "files":
+            return api.upload_nzb(path, None)
+        with open(path, "rb") as f:  # what upload_nzb did before the body was streamed
+            return api._post("/transfer/create", data={}, files={"file": f})  # pylint: disable=protected-access
+
+    send(warmup)  # imports, connection pool and the first request are not part of the measurement
+    before = rss_mb()
+    started = time.monotonic()
+    with RssSampler() as sampler, ThreadPoolExecutor(max_workers=len(paths)) as executor:
+        list(executor.map(send, paths))
+    results.put((mode, before, sampler.peak, time.monotonic() - started))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=40, help="size of every NZB")
+    parser.add_argument("--concurrent", type=int, default=4, help="uploads running at the same time")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="premiumarr-upload-")
+    segments = int(args.size_mb * 1024 * 1024 / SEGMENT_LINE_BYTES)
+    stub = PremiumizeStub(StubConfig())
+    api_url = stub.start()
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    print(f"{args.concurrent} concurrent upload(s) of {args.size_mb} MB NZBs")
+    print(f"{'mode':<12} {'RSS before MB':>15} {'peak during MB':>15} {'added MB':>9} {'seconds':>8}")
+    for mode in MODES:
+        paths = write_nzbs(f"{work_dir}/{mode}", args.concurrent, "tv", segments)
+        warmup = write_nzbs(f"{work_dir}/{mode}-warmup", 1, "tv", 10)[0]
+        for path in paths + [warmup]:  # the stub rejects NZBs it has seen before (upload_nzb would work around it)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(f"<!-- {mode} -->\n")
+        proc = ctx.Process(target=upload, args=(api_url, mode, paths, warmup, results))
+        proc.start()
+        proc.join()
+        mode, before, peak, seconds = results.get()
+        print(f"{mode:<12} {before:>15.1f} {peak:>15.1f} {peak - before:>9.1f} {seconds:>8.2f}")
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Check of the intent journal (Manager.reconcile_intents) against the local premiumize stub.
+
+Simulates workers that stopped in the middle of a side effect: an upload that reached premiumize but not the DB,
+an upload that never reached premiumize, a move to done that finished but not in the DB and one that stopped
+halfway. A new Manager has to pick up the transfer instead of uploading again, complete the moved item instead of
+degrading it to 'found' and leave the rest to the stages.
+
+    python bench/check_intents.py
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.premiumize_stub import PremiumizeStub, StubConfig  # noqa: E402 # pylint: disable=wrong-import-position
+from bench.bench_manager import write_nzbs  # noqa: E402 # pylint: disable=wrong-import-position
+
+WORKER = "check-worker"
+
+
+def main():
+    work_dir = tempfile.mkdtemp(prefix="premiumarr-intents-")
+    paths = {name: f"{work_dir}/{name}" for name in ["blackhole", "downloads", "done", "config"]}
+    for path in paths.values():
+        os.makedirs(path, exist_ok=True)
+    stub = PremiumizeStub(StubConfig(transfer_seconds=60))
+    os.environ["PREMIUMIZE_API_URL"] = stub.start()
+    os.environ["CONFIG_PATH"] = paths["config"]
+    os.environ["WORKER_ID"] = WORKER
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    from src.manager import Manager  # pylint: disable=import-outside-toplevel
+    from src.premiumize_api import PremiumizeAPI  # pylint: disable=import-outside-toplevel
+
+    manager = Manager(stub.config.api_key, tuple(paths.values()), 1, -1, 1)
+    db, account = manager.db, next(iter(manager.pool))
+    nzbs = write_nzbs(paths["blackhole"], 4, "tv", 5)
+
+    def add_item(nzb: str, state: str) -> int:
+        q = "INSERT INTO data (nzb_name, state, full_path, category_path, lease_owner) VALUES (?, ?, ?, '/tv', ?)"
+        d_id = db.conn.execute(q, (os.path.basename(nzb), state, nzb, WORKER)).lastrowid
+        db.conn.commit()
+        return d_id
+
+    # 1: the upload reached premiumize, the worker stopped before the state update
+    uploaded = add_item(nzbs[0], "found")
+    db.begin_intent(uploaded, "upload", {"nzb_name": os.path.basename(nzbs[0]), "account": account.id})
+    transfer_id = PremiumizeAPI(stub.config.api_key).upload_nzb(nzbs[0], None)
+    # 2: the worker stopped before the upload
+    not_uploaded = add_item(nzbs[1], "found")
+    db.begin_intent(not_uploaded, "upload", {"nzb_name": os.path.basename(nzbs[1]), "account": account.id})
+    # 3: all files were moved to done, the worker stopped before the state update
+    moved = add_item(nzbs[2], "downloaded and online cleaned up")
+    dst = f"{paths['done']}/tv/{os.path.basename(nzbs[2])}"
+    os.makedirs(dst)
+    db.begin_intent(moved, "move_to_done", {"src": f"{paths['downloads']}/{os.path.basename(nzbs[2])}", "dst": dst})
+    # 4: the worker stopped halfway through the move
+    half = add_item(nzbs[3], "downloaded and online cleaned up")
+    src = f"{paths['downloads']}/{os.path.basename(nzbs[3])}"
+    os.makedirs(src)
+    os.makedirs(f"{paths['done']}/tv/{os.path.basename(nzbs[3])}")
+    db.begin_intent(half, "move_to_done", {"src": src, "dst": f"{paths['done']}/tv/{os.path.basename(nzbs[3])}"})
+
+    Manager(stub.config.api_key, tuple(paths.values()), 1, -1, 1).reconcile_intents()  # the restarted worker
+
+    def row(d_id):
+        return db.conn.execute("SELECT state, dl_id FROM data WHERE id = ?", (d_id,)).fetchone()
+
+    checks = {
+        "upload that reached premiumize is watched": tuple(row(uploaded)) == ("uploaded", transfer_id),
+        "upload that never happened stays 'found'": row(not_uploaded)["state"] == "found",
+        "finished move completes the item": row(moved)["state"] == "done",
+        "half finished move is left to move_to_done": row(half)["state"] == "downloaded and online cleaned up",
+        "no transfer was created twice": len(stub.accounts[stub.config.api_key].transfers) == 1,
+        "the journal is empty": db.conn.execute("SELECT COUNT(*) FROM intents").fetchone()[0] == 0,
+    }
+    for name, ok in checks.items():
+        print(f"{'OK  ' if ok else 'FAIL'} {name}")
+    stub.stop()
+    sys.exit(0 if all(checks.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
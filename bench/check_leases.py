@@ -0,0 +1,222 @@
+"""
+Multi-process check of the lease model (Database.claim / renew_leases) on a local SQLite file.
+
+Several worker processes claim items from the same data table and "work" on them. One worker crashes (os._exit)
+while holding leases, its items have to be picked up by the others once the leases expired. Checks that
+every item is finished exactly once and that no item was held by two workers at the same time.
+
+Then two Managers share one DB and the local premiumize stub: an item is handed back and forth between them while
+the previous owner is still in the middle of a stage (stalled past its lease), the fenced state updates of the
+previous owner must not go through and it must drop the item.
+
+    python bench/check_leases.py --workers 4 --items 200
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+STATE = "in premiumize cloud"
+
+
+def worker(config_path: str, worker_id: str, ttl: int, work_s: float, crash_after: int, results):
+    os.environ["CONFIG_PATH"] = config_path
+    os.environ["LOG_LEVEL"] = "WARNING"
+    from src.db import Database  # pylint: disable=import-outside-toplevel
+
+    db = Database(config_path)
+    done = 0
+    idle_since = None
+    while True:
+        claimed = db.claim(worker_id, ttl, [STATE], limit=1)
+        if not claimed:
+            idle_since = idle_since or time.monotonic()
+            if time.monotonic() - idle_since > ttl + 2:  # nothing left, not even expired leases
+                return
+            time.sleep(0.05)
+            continue
+        idle_since = None
+
+        d_id = claimed[0][0]
+        started = time.time()
+        if crash_after is not None and done >= crash_after:
+            db.claim(worker_id, ttl, [STATE], limit=3)  # hold a few more leases and die with them
+            os._exit(1)  # pylint: disable=protected-access # simulate a crash, no cleanup
+
+        time.sleep(work_s)
+        cursor = db.conn.cursor()
+        cursor.execute(
+            "UPDATE data SET state = 'done' WHERE id = ? AND lease_owner = ? AND state = ?", (d_id, worker_id, STATE)
+        )
+        finished = cursor.rowcount
+        db.conn.commit()
+        cursor.close()
+        results.put((d_id, worker_id, started, time.time(), finished))
+        done += 1
+
+
+def check_manager_stages() -> bool:
+    from bench.premiumize_stub import PremiumizeStub, StubConfig  # pylint: disable=import-outside-toplevel
+    from bench.bench_manager import write_nzbs  # pylint: disable=import-outside-toplevel
+
+    work_dir = tempfile.mkdtemp(prefix="premiumarr-stages-")
+    paths = {name: f"{work_dir}/{name}" for name in ["blackhole", "downloads", "done", "config"]}
+    for path in [*paths.values(), f"{paths['done']}/tv"]:
+        os.makedirs(path, exist_ok=True)
+    stub = PremiumizeStub(StubConfig(transfer_seconds=0.2, moving_seconds=0.1, file_size_kb=64))
+    os.environ["PREMIUMIZE_API_URL"] = stub.start()
+    os.environ["CONFIG_PATH"] = paths["config"]
+    from src.manager import Manager  # pylint: disable=import-outside-toplevel
+
+    managers = {}
+    for worker_id in ["worker-a", "worker-b"]:
+        manager = Manager(stub.config.api_key, tuple(paths.values()), 1, -1, 1)
+        manager.worker_id = manager.fm.owner = worker_id
+        manager.run_cloud_checks(list(manager.pool))
+        managers[worker_id] = manager
+    a, b = managers["worker-a"], managers["worker-b"]
+    db = a.db
+    transfers = stub.accounts[stub.config.api_key].transfers
+    checks = {}
+
+    def take_over(d_id: int, new_owner: "Manager"):
+        """The lease of the current owner expired (it stalled), new_owner claims the item"""
+        db.conn.execute("UPDATE data SET lease_expires = 0 WHERE id = ?", (d_id,))
+        db.conn.commit()
+        new_owner.adopt_unowned_items()
+        new_owner.claim_downloads()
+
+    def row(d_id: int):
+        return db.conn.execute("SELECT state, lease_owner FROM data WHERE id = ?", (d_id,)).fetchone()
+
+    # upload: a's transfer would be a second one next to the one of the new owner, a deletes it again
+    nzb = write_nzbs(f"{paths['blackhole']}", 2, "tv", 5)
+    a.check_folder_for_incoming_nzbs()
+    stalled, d_id = [db.conn.execute("SELECT id FROM data WHERE full_path = ?", (p,)).fetchone()[0] for p in nzb]
+    take_over(stalled, b)
+    a.to_premiumize = [entry for entry in a.to_premiumize if entry[0] == nzb[0]]
+    a.upload_nzbs_to_premiumize_downloader()
+    checks["upload: the state of the new owner stays"] = tuple(row(stalled)) == ("found", "worker-b")
+    checks["upload: the transfer of the old owner is deleted"] = len(transfers) == 0 and not a.to_premiumize
+
+    # the second item goes through all stages, before every state update the other manager takes it over
+    a.to_premiumize = [entry for entry in a.to_premiumize if entry[0] == nzb[1]] or [(nzb[1], "/tv")]
+    a.upload_nzbs_to_premiumize_downloader()
+    time.sleep(0.5)  # the transfer finishes
+    take_over(d_id, b)
+    a.check_premiumize_downloader_state()
+    checks["finished transfer: fenced"] = tuple(row(d_id)) == ("uploaded", "worker-b") and not a.to_watch
+    b.restore_queue("uploaded")
+    b.check_premiumize_downloader_state()
+
+    take_over(d_id, a)
+    b.download_files_from_premiumize()
+    checks["download: fenced"] = tuple(row(d_id)) == ("in premiumize cloud", "worker-a") and not b.to_download
+    a.download_files_from_premiumize()
+
+    cleanup_item = a.cleanup_item
+
+    def stalled_cleanup(*item):
+        take_over(d_id, b)
+        return cleanup_item(*item)
+
+    a.cleanup_item = stalled_cleanup
+    a.cleanup_online_files()
+    checks["cleanup: fenced"] = tuple(row(d_id)) == ("downloaded", "worker-b")
+    b.cleanup_online_files()
+
+    move_and_integrate = b.fm.move_and_integrate
+
+    def stalled_move(*args):
+        move_and_integrate(*args)
+        take_over(d_id, a)
+
+    b.fm.move_and_integrate = stalled_move
+    b.move_to_done()
+    checks["move to done: fenced"] = tuple(row(d_id)) == ("downloaded and online cleaned up", "worker-a")
+    a.reconcile_intents()  # the new owner finishes the move of the old one from its intent
+    checks["move to done: the new owner completes the item"] = row(d_id)["state"] == "done"
+
+    for name, ok in checks.items():
+        print(f"{'OK  ' if ok else 'FAIL'} {name}")
+    stub.stop()
+    return all(checks.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--ttl", type=int, default=2, help="lease ttl in seconds")
+    parser.add_argument("--work-ms", type=float, default=10, help="time a worker spends on an item")
+    args = parser.parse_args()
+
+    config_path = tempfile.mkdtemp(prefix="premiumarr-leases-")
+    os.environ["CONFIG_PATH"] = config_path
+    os.environ["LOG_LEVEL"] = "WARNING"
+    from src.db import Database  # pylint: disable=import-outside-toplevel
+
+    db = Database(config_path)
+    db.conn.executemany(
+        "INSERT INTO data (nzb_name, state, full_path, category_path) VALUES (?, ?, ?, '/tv')",
+        [(f"item{i}.nzb", STATE, f"/blackhole/tv/item{i}.nzb") for i in range(args.items)],
+    )
+    db.conn.commit()
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    crash_after = args.items // (args.workers * 4)
+    procs = [
+        ctx.Process(
+            target=worker,
+            args=(config_path, f"worker-{i}", args.ttl, args.work_ms / 1000, crash_after if i == 0 else None, results),
+        )
+        for i in range(args.workers)
+    ]
+    started = time.monotonic()
+    for proc in procs:
+        proc.start()
+
+    records = []
+    while any(proc.is_alive() for proc in procs) or not results.empty():
+        try:
+            records.append(results.get(timeout=0.5))
+        except Exception:  # pylint: disable=broad-except # queue.Empty
+            pass
+    elapsed = time.monotonic() - started
+
+    finished = [r for r in records if r[4]]
+    by_item = {}
+    for d_id, owner, begin, end, _ in finished:
+        by_item.setdefault(d_id, []).append((owner, begin, end))
+    left = db.conn.execute("SELECT COUNT(*) FROM data WHERE state != 'done'").fetchone()[0]
+    per_worker = {}
+    for _, owner, *_ in finished:
+        per_worker[owner] = per_worker.get(owner, 0) + 1
+
+    print(f"{args.items} items, {args.workers} workers (worker-0 crashes after {crash_after}), {elapsed:.2f}s")
+    print(f"finished per worker: {dict(sorted(per_worker.items()))}")
+    ok = True
+    if left:  # e.g. the leases of the crashed worker were never taken over
+        print(f"FAIL: {left} item(s) never finished")
+        ok = False
+    duplicates = [d_id for d_id, runs in by_item.items() if len(runs) > 1]
+    if duplicates:
+        print(f"FAIL: items finished more than once: {duplicates[:10]}")
+        ok = False
+    lost = [r for r in records if not r[4]]
+    if lost:
+        print(f"FAIL: {len(lost)} item(s) were worked on after their lease was taken over")
+        ok = False
+    print("OK: every item finished exactly once, leases of the crashed worker were taken over" if ok else "FAILED")
+    ok = check_manager_stages() and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+"""
+Local stand-in for the parts of the premiumize.me API that PremiumizeAPI talks to.
+
+Transfers walk through 'running' -> 'Moving to cloud' -> 'finished' based on wall clock time, finished transfers get a
+folder with generated files whose links are served by the stub itself. Latency and failures can be injected.
+api_key can hold several comma separated keys, each key is a separate account with its own folders and transfers.
+
+Run standalone:  python bench/premiumize_stub.py --port 8765 --latency-ms 50
+and point the manager at it with:  PREMIUMIZE_API_URL=http://127.0.0.1:8765/api
+"""
+
+import argparse
+import gzip
+import hashlib
+import io
+import itertools
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from flask import Flask, g, jsonify, request, send_file, abort
+from werkzeug.serving import make_server
+
+
+# not part of the API response
+INTERNAL_TRANSFER_KEYS = ["target_folder_id", "started", "will_fail", "created", "moved_to"]
+
+
+@dataclass
+class StubConfig:
+    api_key: str = "stub-key"  # comma separated for several accounts
+    latency_ms: int = 0  # added to every API call
+    failure_rate: float = 0.0  # probability of answering an API call with HTTP 500
+    transfer_error_rate: float = 0.0  # probability that a transfer ends in 'error' (cleared by /transfer/retry)
+    transfer_seconds: float = 2.0  # time a transfer spends 'running'
+    moving_seconds: float = 1.0  # time a transfer spends at 'Moving to cloud'
+    files_per_transfer: int = 1
+    file_size_kb: int = 1024
+    max_active_transfers: int = 0  # per account, further transfers stay 'queued' until a slot is free (0 = no limit)
+    provide_hashes: bool = False  # add an md5 of each file to the folder listing
+    seed: int = 0
+
+
+class StubAccount:
+    """Folders, files and transfers of one fake account"""
+
+    def __init__(self, stub: "PremiumizeStub"):
+        self.stub = stub
+        self.root_id = "root"
+        self.folders = {self.root_id: {"name": "root", "parent_id": None, "folders": [], "files": []}}
+        self.files = {}  # file_id -> {name, size}
+        self.transfers = {}  # transfer_id -> dict
+        self.transfer_ids = itertools.count(1)  # only unique per account, like the real ids: accounts share them
+        self.nzb_hashes = set()
+
+    def _new_id(self):
+        return uuid.uuid4().hex[:20]
+
+    def _create_folder(self, name: str, parent_id: str):
+        for f_id in self.folders[parent_id]["folders"]:
+            if self.folders[f_id]["name"] == name:
+                return None
+        f_id = self._new_id()
+        self.folders[f_id] = {"name": name, "parent_id": parent_id, "folders": [], "files": []}
+        self.folders[parent_id]["folders"].append(f_id)
+        return f_id
+
+    def _delete_folder(self, f_id: str):
+        folder = self.folders.pop(f_id)
+        for child in folder["folders"]:
+            self._delete_folder(child)
+        for file_id in folder["files"]:
+            self.files.pop(file_id, None)
+        if folder["parent_id"] in self.folders:
+            self.folders[folder["parent_id"]]["folders"].remove(f_id)
+
+    def used_bytes(self):
+        return sum(f["size"] for f in self.files.values())
+
+    def _start_queued(self):
+        """Starts queued transfers (oldest first) while there are free slots"""
+        limit = self.stub.config.max_active_transfers
+        active = [t for t in self.transfers.values() if t["status"] not in ["finished", "error", "queued"]]
+        for transfer in sorted(self.transfers.values(), key=lambda t: t["created"]):
+            if transfer["status"] == "queued" and (not limit or len(active) < limit):
+                transfer.update(status="waiting", started=time.monotonic())
+                active.append(transfer)
+
+    def _advance(self, transfer: dict):
+        """Moves a transfer along its lifecycle based on the time since it was (re)started"""
+        if transfer["status"] in ["finished", "error", "queued"]:
+            return
+        cfg = self.stub.config
+        elapsed = time.monotonic() - transfer["started"]
+        total_mb = cfg.files_per_transfer * cfg.file_size_kb / 1024
+        if elapsed < cfg.transfer_seconds:
+            progress = elapsed / cfg.transfer_seconds if cfg.transfer_seconds else 1.0
+            eta = time.strftime("%H:%M:%S", time.gmtime(cfg.transfer_seconds - elapsed))
+            transfer.update(
+                status="running",
+                progress=round(progress, 2),
+                message=f"{int(progress * 100)}% of {total_mb:06.2f} MB. ETA is {eta}",
+            )
+        elif elapsed < cfg.transfer_seconds + cfg.moving_seconds:
+            transfer.update(status="running", progress=1, message="Moving to cloud")
+            if not transfer["will_fail"] and transfer["moved_to"] is None:  # the folder shows up while moving
+                transfer["moved_to"] = self._move_to_cloud(transfer)
+        elif transfer["will_fail"]:
+            transfer.update(status="error", progress=0, message="Could not download the file.")
+        else:
+            f_id = transfer["moved_to"] or self._move_to_cloud(transfer)
+            transfer.update(status="finished", progress=1, message=None, folder_id=f_id)
+
+    def _move_to_cloud(self, transfer: dict) -> str:
+        """Creates the folder of a transfer with its files, the transfer only reports it once it is finished"""
+        cfg = self.stub.config
+        name = transfer["name"]
+        f_id = self._create_folder(name, transfer["target_folder_id"]) or self._new_id()
+        self.folders.setdefault(f_id, {"name": name, "parent_id": None, "folders": [], "files": []})
+        for i in range(cfg.files_per_transfer):
+            file_id = self._new_id()
+            self.files[file_id] = {"name": f"{name}.part{i:02d}.mkv", "size": cfg.file_size_kb * 1024}
+            self.folders[f_id]["files"].append(file_id)
+        return f_id
+
+    def file_item(self, file_id: str):
+        f = self.files[file_id]
+        link = f"{self.stub.base_url}/files/{file_id}/{f['name']}"
+        item = {
+            "id": file_id,
+            "name": f["name"],
+            "type": "file",
+            "created_at": 0,
+            "size": f["size"],
+            "link": link,
+            "directlink": link,
+        }
+        if self.stub.config.provide_hashes:
+            item["md5"] = hashlib.md5(self.stub.payload(f["size"])).hexdigest()
+        return item
+
+    def folder_item(self, f_id: str):
+        return {"id": f_id, "name": self.folders[f_id]["name"], "type": "folder", "created_at": 0}
+
+
+class PremiumizeStub:
+    """In-memory state of the fake accounts, all mutations go through self.lock"""
+
+    def __init__(self, config: StubConfig = None):
+        self.config = config or StubConfig()
+        self.lock = threading.Lock()
+        self.random = random.Random(self.config.seed)
+        self.calls = Counter()
+        self.accounts = {key.strip(): StubAccount(self) for key in self.config.api_key.split(",") if key.strip()}
+        self.base_url = None
+        self._server = None
+        self._payloads = {}  # size -> bytes, the same payload is served for all files of a size
+
+    # --- lifecycle ---
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Starts the stub in a background thread and returns the API base url"""
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)  # no access log line per API call
+        self._server = make_server(host, port, create_app(self), threaded=True)
+        self.base_url = f"http://{host}:{self._server.server_port}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"{self.base_url}/api"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+
+    # --- helpers ---
+
+    def payload(self, size: int) -> bytes:
+        if size not in self._payloads:
+            block = hashlib.sha256(str(size).encode()).digest()
+            self._payloads[size] = (block * (size // len(block) + 1))[:size]
+        return self._payloads[size]
+
+    def find_file(self, file_id: str):
+        for account in self.accounts.values():
+            if file_id in account.files:
+                return account.files[file_id]
+        return None
+
+
+def add_config_arguments(parser):
+    """Adds a --flag for every StubConfig field"""
+    for field, default in vars(StubConfig()).items():
+        if isinstance(default, bool):
+            parser.add_argument(f"--{field.replace('_', '-')}", action="store_true", default=default)
+        else:
+            parser.add_argument(f"--{field.replace('_', '-')}", type=type(default), default=default)
+
+
+class GzipRequestMiddleware:
+    """Decodes request bodies sent with Content-Encoding: gzip (UPLOAD_COMPRESSION=gzip), they come chunked"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        if environ.get("HTTP_CONTENT_ENCODING") == "gzip":
+            environ["wsgi.input"] = gzip.GzipFile(fileobj=environ["wsgi.input"])
+            environ["wsgi.input_terminated"] = True
+            environ.pop("CONTENT_LENGTH", None)
+        return self.wsgi_app(environ, start_response)
+
+
+def create_app(stub: PremiumizeStub) -> Flask:
+    app = Flask(__name__)
+    app.wsgi_app = GzipRequestMiddleware(app.wsgi_app)
+    cfg = stub.config
+
+    @app.before_request
+    def inject():
+        if not request.path.startswith("/api/"):
+            return None
+        stub.calls[request.path[len("/api") :]] += 1
+        if cfg.latency_ms:
+            time.sleep(cfg.latency_ms / 1000)
+        g.account = stub.accounts.get(request.values.get("apikey"))
+        if g.account is None:
+            return jsonify({"status": "error", "message": "Not logged in."})
+        with stub.lock:
+            fail = stub.random.random() < cfg.failure_rate
+        if fail:
+            return "injected failure", 500
+        return None
+
+    @app.route("/api/account/info")
+    def account_info():
+        account = g.account
+        with stub.lock:
+            used = account.used_bytes()
+            active = sum(t["status"] not in ["finished", "error"] for t in account.transfers.values())
+        return jsonify(
+            {
+                "status": "success",
+                "customer_id": "1234567",
+                "premium_until": int(time.time()) + 86400 * 30,
+                "limit_used": min(1.0, active / 100),  # stands in for the fair use points
+                "space_used": float(used),  # bytes, like premiumize
+            }
+        )
+
+    @app.route("/api/folder/create", methods=["POST"])
+    def folder_create():
+        account = g.account
+        parent_id = request.form.get("parent_id") or account.root_id
+        with stub.lock:
+            if parent_id not in account.folders:
+                return jsonify({"status": "error", "message": "Parent folder not found."})
+            f_id = account._create_folder(request.form["name"], parent_id)
+        if f_id is None:
+            return jsonify({"status": "error", "message": "This folder already exists."})
+        return jsonify({"status": "success", "id": f_id})
+
+    @app.route("/api/folder/list")
+    def folder_list():
+        account = g.account
+        f_id = request.args.get("id") or account.root_id
+        with stub.lock:
+            if f_id not in account.folders:
+                return jsonify({"status": "error", "message": "Folder not found."})
+            folder = account.folders[f_id]
+            content = [account.folder_item(c) for c in folder["folders"]]
+            content += [account.file_item(c) for c in folder["files"]]
+        return jsonify(
+            {"status": "success", "content": content, "name": folder["name"], "parent_id": folder["parent_id"]}
+        )
+
+    @app.route("/api/folder/delete", methods=["POST"])
+    def folder_delete():
+        account = g.account
+        with stub.lock:
+            if request.form["id"] not in account.folders:
+                return jsonify({"status": "error", "message": "Folder not found."})
+            account._delete_folder(request.form["id"])
+        return jsonify({"status": "success"})
+
+    @app.route("/api/item/delete", methods=["POST"])
+    def item_delete():
+        account = g.account
+        with stub.lock:
+            file_id = request.form["id"]
+            if account.files.pop(file_id, None) is None:
+                return jsonify({"status": "error", "message": "Item not found."})
+            for folder in account.folders.values():
+                if file_id in folder["files"]:
+                    folder["files"].remove(file_id)
+        return jsonify({"status": "success"})
+
+    @app.route("/api/transfer/create", methods=["POST"])
+    def transfer_create():
+        account = g.account
+        upload = request.files.get("file")
+        if upload is None:
+            return jsonify({"status": "error", "message": "Only nzb uploads are supported by the stub."})
+        digest = hashlib.sha256(upload.read()).hexdigest()
+        name = upload.filename.removesuffix(".nzb")  # like premiumize: transfer and folder are named without .nzb
+        with stub.lock:
+            if digest in account.nzb_hashes:
+                return jsonify({"status": "error", "message": "You have already added this nzb file."})
+            account.nzb_hashes.add(digest)
+            t_id = f"t{next(account.transfer_ids):08d}"
+            account.transfers[t_id] = {
+                "id": t_id,
+                "name": name,
+                "message": None,
+                "status": "queued" if cfg.max_active_transfers else "waiting",  # _start_queued picks it up
+                "progress": 0,
+                "folder_id": None,
+                "src": f"{stub.base_url}/api/job/src?id={t_id}",
+                "target_folder_id": request.form.get("folder_id") or account.root_id,
+                "started": time.monotonic(),
+                "created": time.monotonic(),
+                "will_fail": stub.random.random() < cfg.transfer_error_rate,
+                "moved_to": None,
+            }
+        return jsonify({"status": "success", "id": t_id, "name": name, "type": "nzb"})
+
+    @app.route("/api/transfer/list")
+    def transfer_list():
+        account = g.account
+        with stub.lock:
+            transfers = []
+            account._start_queued()
+            for transfer in account.transfers.values():
+                account._advance(transfer)
+                transfers.append({k: v for k, v in transfer.items() if k not in INTERNAL_TRANSFER_KEYS})
+        return jsonify({"status": "success", "transfers": transfers})
+
+    @app.route("/api/transfer/delete", methods=["POST"])
+    def transfer_delete():
+        account = g.account
+        with stub.lock:
+            if account.transfers.pop(request.form["id"], None) is None:
+                return jsonify({"status": "error", "message": "Transfer not found."})
+        return jsonify({"status": "success"})
+
+    @app.route("/api/transfer/retry", methods=["POST"])
+    def transfer_retry():
+        account = g.account
+        with stub.lock:
+            transfer = account.transfers.get(request.form["id"])
+            if transfer is None:
+                return jsonify({"status": "error", "message": "Transfer not found."})
+            transfer.update(status="waiting", started=time.monotonic(), will_fail=False)
+        return jsonify({"status": "success"})
+
+    @app.route("/api/transfer/clearfinished", methods=["POST"])
+    def transfer_clearfinished():
+        account = g.account
+        with stub.lock:
+            for t_id in [t_id for t_id, t in account.transfers.items() if t["status"] == "finished"]:
+                account.transfers.pop(t_id)
+        return jsonify({"status": "success"})
+
+    @app.route("/files/<file_id>/<name>")
+    def serve_file(file_id, name):  # pylint: disable=unused-argument # the name is only there for nicer urls
+        with stub.lock:
+            file = stub.find_file(file_id)
+            if file is None:
+                abort(404)
+            data = stub.payload(file["size"])
+        stub.calls["/files"] += 1
+        return send_file(io.BytesIO(data), mimetype="application/octet-stream", conditional=True, etag=False)
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local premiumize.me API stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    stub_cfg = StubConfig(**{k: v for k, v in vars(args).items() if k in vars(StubConfig())})
+    server = PremiumizeStub(stub_cfg)
+    print(f"Stub API listening on {server.start(args.host, args.port)} (api key: {stub_cfg.api_key})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
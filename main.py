@@ -1,5 +1,5 @@
 import os
-from time import sleep
+from time import sleep, monotonic
 from src.manager import Manager
 from src.helper import RetryHandler, get_logger
 from tenacity import retry, wait_exponential as w_exp, stop_after_attempt as tries
@@ -15,6 +15,7 @@ DL_SPEED_LIMIT_KB = int(os.getenv("DOWNLOAD_SPEED_LIMIT_KB", "-1"))
 DL_THREADS = int(os.getenv("DOWNLOAD_THREADS", "2"))
 CHK_DELAY = int(os.getenv("RECHECK_PREMIUMIZE_CLOUD_DELAY", "60"))
 API_KEY = os.getenv("API_KEY")
+MAX_RESTART_BACKOFF = 120
 
 
 def check_path(dir_path, dir_name):
@@ -25,11 +26,6 @@ def check_path(dir_path, dir_name):
         raise RuntimeError(f"{dir_name} directory is not writable: {dir_path}, check your mounts and configuration")
 
 
-@retry(wait=120, retry_error_callback=rh.on_fail, before_sleep=rh.on_retry)
-def run_manager(manager: Manager):
-    manager.run()
-
-
 @retry(wait=w_exp(max=300), retry_error_callback=rh.on_fail, before_sleep=rh.on_retry)
 def main():
     if not API_KEY:
@@ -43,13 +39,19 @@ def main():
     os.makedirs(f"{CONFIG_PATH}/archive", exist_ok=True)
 
     manager = Manager(API_KEY, list(paths.keys()), DL_THREADS, DL_SPEED_LIMIT_KB, CHK_DELAY)
-    RESTART_AFTER_FATAL_TIME = 60
+    manager.archive.import_flat_files()  # NZBs archived by older versions
+    manager.profiler.install()  # SIGUSR1 / SIGUSR2 or the /api/profile route of the webserver
+    backoff = 1
     while True:  # prevent the script from crashing
+        started = monotonic()
         try:
             manager.run()
         except Exception as e:  # pylint: disable=broad-except # we intentionally catch all exceptions
-            logger.error(f"Manager failed: {str(e)} - restarting in {RESTART_AFTER_FATAL_TIME}s ...")
-            sleep(RESTART_AFTER_FATAL_TIME)
+            if monotonic() - started > MAX_RESTART_BACKOFF:  # it ran fine for a while -> restart quickly
+                backoff = 1
+            logger.error(f"Manager failed: {str(e)} - restarting in {backoff}s ...")
+            sleep(backoff)
+            backoff = min(backoff * 2, MAX_RESTART_BACKOFF)
 
 
 if __name__ == "__main__":
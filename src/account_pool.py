@@ -0,0 +1,168 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from src.premiumize_api import PremiumizeAPI, TransItem
+from src.helper import get_logger
+
+logger = get_logger(__name__)
+
+MAX_TRANSFERS_PER_ACCOUNT = int(os.getenv("MAX_TRANSFERS_PER_ACCOUNT", "25"))  # active transfers we put on one key
+ACCOUNT_INFO_TTL_S = int(os.getenv("ACCOUNT_INFO_TTL_S", "300"))
+QUOTA_RESERVE = 0.02  # accounts with less than 2% of fair use left don't get new uploads
+# account/info reports the used cloud space in bytes, the share of it is taken of this capacity
+CLOUD_SPACE_LIMIT_GB = float(os.getenv("CLOUD_SPACE_LIMIT_GB", "1000"))
+# uploads to an account pause while less cloud space than this is left: the running transfers still fill it up and
+# a transfer that finds the cloud full fails
+CLOUD_SPACE_RESERVE = float(os.getenv("CLOUD_SPACE_RESERVE", "0.1"))
+ACTIVE_STATES = ["waiting", "queued", "running"]
+
+
+def account_id_of(api_key: str) -> str:
+    """Stable id for an API key that can be stored and logged (the key itself never is)"""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:12]
+
+
+def parse_api_keys(value: str) -> list[str]:
+    """API_KEY may hold several comma separated keys, the first one is the primary account"""
+    return [key.strip() for key in (value or "").split(",") if key.strip()]
+
+
+class Account:
+    """One premiumize account: its API client, cloud root folder and the last known load"""
+
+    def __init__(self, api_key: str):
+        self.id = account_id_of(api_key)
+        self.api = PremiumizeAPI(api_key)
+        self.root_id = None  # set once the cloud checks for this account are done
+        self.info = {}
+        self.info_at = 0
+        self.active_transfers = 0  # from the last transfer list
+        self.uploads_since_poll = 0  # uploads the last transfer list doesn't know about yet
+        self.quota_paused = False
+
+    def free_slots(self) -> int:
+        return MAX_TRANSFERS_PER_ACCOUNT - self.active_transfers - self.uploads_since_poll
+
+    def fair_use_left(self) -> float:
+        return max(0.0, 1.0 - float(self.info.get("limit_used") or 0))
+
+    def space_used(self) -> float:
+        """Share of the cloud space in use, 0..1 (space_used is in bytes, limit_used is already a share)"""
+        return float(self.info.get("space_used") or 0) / (CLOUD_SPACE_LIMIT_GB * 1024**3)
+
+    def space_left(self) -> float:
+        return max(0.0, 1.0 - self.space_used())
+
+    def quota_left(self) -> float:
+        """Share of the fair use limit and cloud space that is still left (the smaller one), 0..1"""
+        return min(self.fair_use_left(), self.space_left())
+
+    def takes_uploads(self) -> bool:
+        """False while the fair use or the cloud space of the account is close to its limit"""
+        ok = self.fair_use_left() > QUOTA_RESERVE and self.space_left() > CLOUD_SPACE_RESERVE
+        if ok == self.quota_paused:  # only log the changes
+            self.quota_paused = not ok
+            if ok:
+                logger.info(f"Resuming uploads to account {self.id}, {self.quota_left():.0%} quota left")
+            else:
+                logger.warning(
+                    f"Pausing uploads to account {self.id}: {self.fair_use_left():.0%} fair use and "
+                    + f"{self.space_left():.0%} cloud space left"
+                )
+        return ok
+
+    def __str__(self):
+        return f"account {self.id} ({self.free_slots()} free slots, {self.quota_left():.0%} quota left)"
+
+
+class AccountPool:
+    """
+    Spreads the transfers over several premiumize accounts. New uploads go to the account with free transfer slots
+    and the most quota left (from account/info, cached for ACCOUNT_INFO_TTL_S), everything that follows an upload
+    (polling, retries, downloads, cleanup) uses the account stored with the item.
+    """
+
+    def __init__(self, api_keys: list[str]):
+        assert api_keys, "At least one API key is required"
+        self.accounts = {}
+        for key in api_keys:
+            account = Account(key)
+            self.accounts.setdefault(account.id, account)  # the same key twice is still one account
+        self.primary = next(iter(self.accounts))
+        self.executor = ThreadPoolExecutor(max_workers=len(self.accounts), thread_name_prefix="account")
+        self.lock = threading.Lock()
+        logger.info(f"Using {len(self.accounts)} premiumize account(s): {', '.join(self.accounts)}")
+
+    def __iter__(self):
+        return iter(self.accounts.values())
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def get(self, account_id: str = None) -> Account:
+        """The account of an item, items from before the pool existed (NULL) belong to the primary account"""
+        account = self.accounts.get(account_id or self.primary)
+        if account is None:
+            logger.error(f"Unknown account {account_id} (was its API key removed?) - using the primary account")
+            account = self.accounts[self.primary]
+        return account
+
+    def api(self, account_id: str = None) -> PremiumizeAPI:
+        return self.get(account_id).api
+
+    def refresh_info(self):
+        """Fetches account/info in parallel for all accounts whose cached info is older than ACCOUNT_INFO_TTL_S"""
+        stale = [acc for acc in self if time.monotonic() - acc.info_at > ACCOUNT_INFO_TTL_S]
+        for account, info in zip(stale, self.executor.map(self._fetch_info, stale)):
+            if info:
+                account.info, account.info_at = info, time.monotonic()
+
+    def _fetch_info(self, account: Account):
+        try:
+            info = account.api.get_account_info()
+        except Exception as e:  # pylint: disable=broad-except # the old info is kept until the next try
+            logger.warning(f"Could not get account info of {account.id}: {e}")
+            return None
+        return info if info and info.get("status") == "success" else None
+
+    def pick_for_upload(self) -> Account:
+        """The ready account with free transfer slots and the most quota left, None if all of them are busy/full"""
+        self.refresh_info()
+        candidates = [acc for acc in self if acc.root_id and acc.free_slots() > 0 and acc.takes_uploads()]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda acc: (acc.quota_left(), acc.free_slots()))
+
+    def note_upload(self, account: Account):
+        with self.lock:
+            account.uploads_since_poll += 1
+
+    def get_transfers(self, account_ids: set[str] = None) -> tuple[list[TransItem], set[str]]:
+        """
+        Polls the transfer lists of the given accounts (default: all) in parallel, every item gets .account set.
+        Returns the transfers and the ids of the accounts that answered, an account that failed to answer must not
+        make its transfers look lost. Raises if no account answered.
+        """
+        accounts = {self.get(a_id) for a_id in account_ids} if account_ids else set(self)
+        futures = {account: self.executor.submit(account.api.get_transfers) for account in accounts}
+        transfers, polled, errors = [], set(), []
+        for account, future in futures.items():
+            try:
+                items = future.result()
+            except Exception as e:  # pylint: disable=broad-except # the other accounts are still polled
+                logger.error(f"Failed to get the transfer list of account {account.id}: {e}")
+                errors.append(e)
+                continue
+            for item in items:
+                item.account = account.id
+            with self.lock:
+                account.active_transfers = sum(item.status in ACTIVE_STATES for item in items)
+                account.uploads_since_poll = 0
+            transfers.extend(items)
+            polled.add(account.id)
+
+        if errors and not polled:
+            raise errors[0]
+        return transfers, polled
@@ -0,0 +1,90 @@
+import os
+import shutil
+import threading
+from src.helper import get_logger
+
+logger = get_logger(__name__)
+
+DISK_SPACE_HEADROOM_MB = int(os.getenv("DISK_SPACE_HEADROOM_MB", "512"))  # always keep this much free
+
+
+def used_bytes(path: str) -> int:
+    """Bytes of all files below path (or of the file itself), 0 if it does not exist yet"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file))
+            except OSError:  # removed while walking
+                pass
+    return total
+
+
+def device_of(path: str) -> int:
+    """st_dev of the path or of its closest existing parent"""
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    return os.stat(path).st_dev
+
+
+class Reservation:
+    """Space an item still needs on one filesystem: size minus what is already written below target"""
+
+    def __init__(self, target: str, size: int):
+        self.target = target
+        self.size = size
+        self.device = device_of(target)
+
+    def outstanding(self) -> int:
+        return max(0, self.size - used_bytes(self.target))
+
+
+class DiskAdmission:
+    """
+    Admission control for local downloads: an item is only started if its whole cloud folder fits on the download
+    filesystem and (if that is a different filesystem) on the done filesystem, after subtracting what the other
+    admitted items still need. The reservations are kept until the item is moved to done (or given up).
+    """
+
+    def __init__(self, headroom_mb: int = DISK_SPACE_HEADROOM_MB):
+        self.headroom = headroom_mb * 1024**2
+        self.reservations: dict[int, list[Reservation]] = {}
+        self.lock = threading.Lock()
+
+    def try_reserve(self, d_id: int, size: int, dl_target: str, done_target: str) -> bool:
+        with self.lock:
+            if d_id in self.reservations:
+                return True
+
+            wanted = [Reservation(dl_target, size)]
+            if device_of(done_target) != wanted[0].device:  # same filesystem -> the move is a rename
+                wanted.append(Reservation(done_target, size))
+
+            for reservation in wanted:
+                free = self.free_bytes(reservation.target, reservation.device)
+                if reservation.outstanding() > free:
+                    logger.warning(
+                        f"Not enough disk space for {reservation.target}: needs "
+                        f"{reservation.outstanding() / 1024**2:.0f} MB, {max(free, 0) / 1024**2:.0f} MB available"
+                    )
+                    return False
+
+            self.reservations[d_id] = wanted
+            return True
+
+    def free_bytes(self, path: str, device: int) -> int:
+        """Free space on the filesystem of path minus the headroom and what other admitted items still need"""
+        while not os.path.exists(path):
+            path = os.path.dirname(path)
+        reserved = sum(r.outstanding() for rs in self.reservations.values() for r in rs if r.device == device)
+        return shutil.disk_usage(path).free - reserved - self.headroom
+
+    def release(self, d_id: int):
+        with self.lock:
+            self.reservations.pop(d_id, None)
+
+    def reserved_bytes(self) -> int:
+        with self.lock:
+            return sum(r.outstanding() for rs in self.reservations.values() for r in rs)
@@ -1,5 +1,7 @@
 import sqlite3
+import json
 import os
+import time
 from src.helper import get_logger
 
 logger = get_logger(__name__)
@@ -14,7 +16,8 @@ class Database:
             logger.info(f"Database file does not exist, creating: {self.path}")
             open(self.path, "w", encoding="utf-8").close()
 
-        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        # several manager workers can share the file, a writer waits for the others instead of failing right away
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
         self.cursor = self.conn.cursor()  # for the main process
         safety_values = {
             1: "Single-Thread, all mutexes are disabled -> Unsafe for multithreading",
@@ -40,7 +43,7 @@ class Database:
             dl_retry_count INTEGER DEFAULT 0,
             dl_folder_id TEXT,
             nzb_name TEXT NOT NULL,
-            cld_dl_timeout_time TIMESTAMP,
+            cld_dl_timeout_time TIMESTAMP, -- epoch
             cld_dl_move_retry_c INTEGER DEFAULT 0,
             state_retry_count INTEGER DEFAULT 0,
             full_path TEXT NOT NULL,
@@ -49,26 +52,183 @@ class Database:
         )
         """
         )
+        self._add_column_if_missing(cursor, "data", "cloud_size", "INTEGER")
+        self._add_column_if_missing(cursor, "data", "account", "TEXT")  # NULL -> primary account
+        self._add_column_if_missing(cursor, "data", "lease_owner", "TEXT")  # worker that currently handles the item
+        self._add_column_if_missing(cursor, "data", "lease_expires", "INTEGER")  # epoch, renewed by the heartbeat
+        self._add_column_if_missing(cursor, "data", "nzb_sha256", "TEXT")  # key of the NZB in the archive
+        cursor.execute("CREATE INDEX IF NOT EXISTS data_nzb_sha256 ON data (nzb_sha256)")
+        self._convert_timeout_times(cursor)
+        cursor.execute(
+            """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT,
+            updated_at INTEGER NOT NULL
+        )
+        """
+        )
+        cursor.execute(
+            """
+        CREATE TABLE IF NOT EXISTS intents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            d_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL, -- JSON, what is needed to find out if the side effect happened
+            created_at INTEGER NOT NULL
+        )
+        """
+        )
+        cursor.execute(
+            """
+        CREATE TABLE IF NOT EXISTS nzb_archive (
+            sha256 TEXT PRIMARY KEY,
+            name TEXT NOT NULL, -- of the first NZB with this content
+            size INTEGER NOT NULL,
+            stored_size INTEGER NOT NULL,
+            archived_at INTEGER NOT NULL
+        )
+        """
+        )
+        cursor.execute(
+            """
+        CREATE TABLE IF NOT EXISTS progress (
+            d_id INTEGER PRIMARY KEY,
+            file TEXT,
+            bytes_done INTEGER,
+            total INTEGER,
+            speed INTEGER, -- bytes per second
+            eta INTEGER, -- seconds
+            updated_at INTEGER NOT NULL
+        )
+        """
+        )
+        cursor.close()
+
+    def _convert_timeout_times(self, cursor):
+        """Migration: older versions stored cld_dl_timeout_time as a 'YYYY-MM-DD HH:MM:SS' UTC string"""
+        cursor.execute(
+            "UPDATE data SET cld_dl_timeout_time = CAST(strftime('%s', cld_dl_timeout_time) AS INTEGER) "
+            + "WHERE typeof(cld_dl_timeout_time) = 'text'"
+        )
+        if cursor.rowcount:
+            logger.info(f"Converted {cursor.rowcount} timeout time(s) to epochs")
+        self.conn.commit()
+
+    def _add_column_if_missing(self, cursor, table: str, column: str, definition: str):
+        """Migration for DBs created by older versions (CREATE TABLE IF NOT EXISTS doesn't add new columns)"""
+        columns = [row["name"] for row in cursor.execute(f"PRAGMA table_info({table})").fetchall()]
+        if column not in columns:
+            logger.info(f"Adding column {column} to table {table}")
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def set_cloud_size(self, d_id, cloud_size):
+        cursor = self.conn.cursor()
+        cursor.execute("UPDATE data SET cloud_size = ? WHERE id = ?", (cloud_size, d_id))
+        self.conn.commit()
         cursor.close()
 
+    def get_meta(self, key: str, max_age: int = None):
+        """Returns the stored value for key, or None if it is missing or older than max_age seconds"""
+        cursor = self.conn.cursor()
+        row = cursor.execute("SELECT value, updated_at FROM meta WHERE key = ?", (key,)).fetchone()
+        cursor.close()
+        if not row or (max_age is not None and time.time() - row["updated_at"] > max_age):
+            return None
+        return row["value"]
+
+    def get_meta_by_prefix(self, prefix: str) -> dict[str, str]:
+        """All values whose key starts with prefix, by the rest of the key"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT key, value FROM meta WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+        rows = cursor.fetchall()
+        cursor.close()
+        return {row["key"][len(prefix) :]: row["value"] for row in rows}
+
+    def set_meta(self, key: str, value: str):
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "INSERT INTO meta (key, value, updated_at) VALUES (?, ?, ?) "
+            + "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+            (key, value, int(time.time())),
+        )
+        self.conn.commit()
+        cursor.close()
+
+    def delete_meta(self, key: str):
+        cursor = self.conn.cursor()
+        cursor.execute("DELETE FROM meta WHERE key = ?", (key,))
+        self.conn.commit()
+        cursor.close()
+
+    def claim(self, owner: str, ttl: int, states: list[str], limit: int = -1) -> list[tuple[int, str]]:
+        """
+        Leases up to limit items in one of states that nobody holds a valid lease on (never leased, released or
+        expired because the worker died) to owner. The UPDATE is atomic, so concurrent workers never get the same
+        item. Returns (id, state) of the claimed items.
+        """
+        now = int(time.time())
+        placeholders = ", ".join("?" * len(states))
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "UPDATE data SET lease_owner = ?, lease_expires = ? WHERE id IN ("
+            + f"SELECT id FROM data WHERE state IN ({placeholders}) AND (lease_owner IS NULL OR lease_expires < ?) "
+            + "ORDER BY id LIMIT ?) RETURNING id, state",
+            (owner, now + ttl, *states, now, limit),
+        )
+        claimed = [(row["id"], row["state"]) for row in cursor.fetchall()]
+        self.conn.commit()
+        cursor.close()
+        return claimed
+
+    def renew_leases(self, owner: str, ttl: int) -> int:
+        """Heartbeat: extends the leases of all unfinished items of owner, returns how many it holds"""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "UPDATE data SET lease_expires = ? WHERE lease_owner = ? AND state NOT IN ('done', 'failed')",
+            (int(time.time()) + ttl, owner),
+        )
+        count = cursor.rowcount
+        self.conn.commit()
+        cursor.close()
+        return count
+
+    def release_lease(self, d_id):
+        """Hands the item over to whichever worker claims it next"""
+        cursor = self.conn.cursor()
+        cursor.execute("UPDATE data SET lease_owner = NULL, lease_expires = NULL WHERE id = ?", (d_id,))
+        self.conn.commit()
+        cursor.close()
+
+    def get_data_version(self) -> int:
+        """Changes whenever another connection (e.g. the manager process) committed a change to the DB"""
+        cursor = self.conn.cursor()
+        version = cursor.execute("PRAGMA data_version").fetchone()[0]
+        cursor.close()
+        return version
+
     def get_current_state(self):
         logger.debug("Fetching current state from database")
         cursor = self.conn.cursor()
         cursor.execute(
             "SELECT id, state, message, created_at, category_path, SUBSTR(nzb_name,1,87) || '...' AS nzb_name, "
-            + "dl_id, dl_retry_count, cld_dl_timeout_time, cld_dl_move_retry_c, state_retry_count "
-            + "FROM data WHERE state NOT IN ('done', 'failed') ORDER BY id DESC"
+            + "dl_id, dl_retry_count, datetime(cld_dl_timeout_time, 'unixepoch') AS cld_dl_timeout_time, "
+            + "cld_dl_move_retry_c, state_retry_count, account, lease_owner, p.file AS dl_file, "
+            + "p.bytes_done AS dl_bytes_done, p.total AS dl_total, p.speed AS dl_speed, p.eta AS dl_eta "
+            + "FROM data LEFT JOIN progress p ON p.d_id = data.id AND data.state = 'in premiumize cloud' "
+            + "WHERE state NOT IN ('done', 'failed') ORDER BY id DESC"
         )
         rows = cursor.fetchall()
         cursor.close()
         return [dict(row) for row in rows]
 
     def get_done_failed_entries(self, limit=10, offset=0):
-        logger.debug(f"Fetching done/failed entries from database with limit={limit} and offset={offset}")
+        logger.debug("Fetching done/failed entries from database with limit=%s and offset=%s", limit, offset)
         cursor = self.conn.cursor()
         cursor.execute(
             "SELECT id, state, message, created_at, category_path, SUBSTR(nzb_name,1,87) || '...' AS nzb_name, "
-            + "dl_id, dl_retry_count, cld_dl_timeout_time, cld_dl_move_retry_c, state_retry_count "
+            + "dl_id, dl_retry_count, datetime(cld_dl_timeout_time, 'unixepoch') AS cld_dl_timeout_time, "
+            + "cld_dl_move_retry_c, state_retry_count "
             + "FROM data WHERE state IN ('done', 'failed') ORDER BY id DESC LIMIT ? OFFSET ?",
             (limit, offset),
         )
@@ -97,6 +257,95 @@ class Database:
         cursor.close()
         return count
 
+    def begin_intent(self, d_id, kind: str, payload: dict) -> int:
+        """Journals an external side effect (upload, move) before it happens, committed right away. A new attempt
+        replaces the intent of an earlier one for the same item."""
+        cursor = self.conn.cursor()
+        cursor.execute("DELETE FROM intents WHERE d_id = ? AND kind = ?", (d_id, kind))
+        cursor.execute(
+            "INSERT INTO intents (d_id, kind, payload, created_at) VALUES (?, ?, ?, ?)",
+            (d_id, kind, json.dumps(payload), int(time.time())),
+        )
+        intent_id = cursor.lastrowid
+        self.conn.commit()
+        cursor.close()
+        return intent_id
+
+    def complete_intent(self, intent_id: int):
+        """Removes the intent and commits, together with the state update the caller executed before"""
+        cursor = self.conn.cursor()
+        cursor.execute("DELETE FROM intents WHERE id = ?", (intent_id,))
+        self.conn.commit()
+        cursor.close()
+
+    def get_pending_intents(self, owner: str):
+        """Intents that were never completed (the worker stopped in between) of the items leased to owner"""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT i.id, i.d_id, i.kind, i.payload, data.state FROM intents i JOIN data ON data.id = i.d_id "
+            + "WHERE data.lease_owner = ? ORDER BY i.id",
+            (owner,),
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+        return [{**dict(row), "payload": json.loads(row["payload"])} for row in rows]
+
+    def add_archived_nzb(self, sha256, name, size, stored_size, d_id=None):
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "INSERT OR IGNORE INTO nzb_archive (sha256, name, size, stored_size, archived_at) VALUES (?, ?, ?, ?, ?)",
+            (sha256, name, size, stored_size, int(time.time())),
+        )
+        if d_id is not None:
+            cursor.execute("UPDATE data SET nzb_sha256 = ? WHERE id = ?", (sha256, d_id))
+        self.conn.commit()
+        cursor.close()
+
+    def get_nzb_sha256(self, d_id):
+        """Hash of the item's NZB as it was found, before upload_nzb appended anything to it"""
+        cursor = self.conn.cursor()
+        row = cursor.execute("SELECT nzb_sha256 FROM data WHERE id = ?", (d_id,)).fetchone()
+        cursor.close()
+        return row["nzb_sha256"] if row else None
+
+    def get_archived_nzb(self, sha256):
+        """The archive entry and the last item that had this NZB (its id and state)"""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT a.*, data.id AS d_id, data.state FROM nzb_archive a "
+            + "LEFT JOIN data ON data.nzb_sha256 = a.sha256 WHERE a.sha256 = ? ORDER BY data.id DESC LIMIT 1",
+            (sha256,),
+        )
+        row = cursor.fetchone()
+        cursor.close()
+        return dict(row) if row else None
+
+    def set_progress(self, d_id, file, bytes_done, total, speed, eta):
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "INSERT OR REPLACE INTO progress (d_id, file, bytes_done, total, speed, eta, updated_at) "
+            + "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (d_id, file, bytes_done, total, speed, eta, int(time.time())),
+        )
+        self.conn.commit()
+        cursor.close()
+
+    def clear_progress(self, d_id):
+        cursor = self.conn.cursor()
+        cursor.execute("DELETE FROM progress WHERE d_id = ?", (d_id,))
+        self.conn.commit()
+        cursor.close()
+
+    def get_progress(self):
+        """Progress of the running local downloads (rows of items that moved on are ignored)"""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT p.* FROM progress p JOIN data ON data.id = p.d_id WHERE data.state = 'in premiumize cloud'"
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+        return [dict(row) for row in rows]
+
     def get_entries_count_by_state(self):
         cursor = self.conn.cursor()
         cursor.execute("SELECT state, COUNT(*) FROM data GROUP BY state")
@@ -135,22 +384,27 @@ class Database:
         cursor.close()
         return last_done
 
-    def reset_to_found(self, d_id, cld_dl_move_retry_c_add=0, state_retry_count_add=0):
+    def reset_to_found(self, d_id, owner, cld_dl_move_retry_c_add=0, state_retry_count_add=0) -> bool:
+        """Like every state transition only done while owner holds the lease, False if another worker took it over"""
         cursor = self.conn.cursor()
         cursor.execute(
             "UPDATE data SET state = 'found', cld_dl_move_retry_c = cld_dl_move_retry_c + ?, dl_id = NULL,"
             + " state_retry_count = state_retry_count + ?, dl_retry_count = 0, dl_folder_id = NULL,"
-            + " cld_dl_timeout_time = NULL, message = NULL WHERE id = ?",
-            (cld_dl_move_retry_c_add, state_retry_count_add, d_id),
+            + " cld_dl_timeout_time = NULL, message = NULL WHERE id = ? AND lease_owner = ?",
+            (cld_dl_move_retry_c_add, state_retry_count_add, d_id, owner),
         )
+        updated = cursor.rowcount > 0
         self.conn.commit()
         cursor.close()
+        return updated
 
-    def mark_as_failed(self, d_id):
+    def mark_as_failed(self, d_id, owner) -> bool:
         cursor = self.conn.cursor()
-        cursor.execute("UPDATE data SET state = 'failed' WHERE id = ?", (d_id,))
+        cursor.execute("UPDATE data SET state = 'failed' WHERE id = ? AND lease_owner = ?", (d_id, owner))
+        updated = cursor.rowcount > 0
         self.conn.commit()
         cursor.close()
+        return updated
 
     def set_message_and_timeout_time(self, d_id, message, timeout_time):
         cursor = self.conn.cursor()
@@ -0,0 +1,60 @@
+import heapq
+import itertools
+import time
+
+
+class DeadlineHeap:
+    """
+    Deadlines by key on the monotonic clock (wall clock jumps don't fire or delay them), the manager loop sleeps
+    until the next one instead of a full check delay. Rescheduling or cancelling a key only updates self.deadlines,
+    the outdated heap entries are skipped when they come up (lazy deletion). The DB stores deadlines as epochs,
+    schedule_epoch converts them.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.deadlines = {}  # key -> monotonic deadline
+        self.counter = itertools.count()  # never compare keys
+
+    def schedule(self, key, delay_s: float):
+        self.schedule_at(key, time.monotonic() + delay_s)
+
+    def schedule_epoch(self, key, epoch: int):
+        self.schedule_at(key, time.monotonic() + (epoch - time.time()))
+
+    def schedule_at(self, key, deadline: float):
+        self.deadlines[key] = deadline
+        heapq.heappush(self.heap, (deadline, next(self.counter), key))
+
+    def cancel(self, key):
+        self.deadlines.pop(key, None)
+
+    def is_due(self, key) -> bool:
+        deadline = self.deadlines.get(key)
+        return deadline is not None and deadline <= time.monotonic()
+
+    def __contains__(self, key):
+        return key in self.deadlines
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def next_wakeup(self) -> float:
+        """
+        Monotonic time of the earliest deadline that is still ahead, None if there is none. Every deadline wakes the
+        loop once, passed ones are dropped from the heap (they stay due for is_due until they are cancelled).
+        """
+        now = time.monotonic()
+        while self.heap:
+            deadline, _, key = self.heap[0]
+            if self.deadlines.get(key) == deadline and deadline > now:
+                return deadline
+            heapq.heappop(self.heap)  # passed, cancelled or rescheduled
+        return None
+
+    def seconds_until_next(self, default: float) -> float:
+        """Time to sleep until the next deadline, but at most default"""
+        deadline = self.next_wakeup()
+        if deadline is None:
+            return default
+        return min(default, deadline - time.monotonic())
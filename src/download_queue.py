@@ -0,0 +1,83 @@
+import heapq
+import itertools
+import os
+import time
+from src.helper import get_logger
+
+logger = get_logger(__name__)
+
+# "tv=0,movies=1" -> items of a lower level go first, unlisted categories get level 0
+CATEGORY_PRIORITIES = os.getenv("CATEGORY_PRIORITIES", "")
+PRIORITY_LEVEL_S = int(os.getenv("DOWNLOAD_PRIORITY_LEVEL_S", "600"))  # head start per priority level
+SIZE_PENALTY_S_PER_GB = int(os.getenv("DOWNLOAD_SIZE_PENALTY_S_PER_GB", "120"))  # how much bigger jobs wait
+
+
+def parse_category_priorities(value: str) -> dict[str, int]:
+    priorities = {}
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        category, _, level = entry.partition("=")
+        priorities[category.strip().strip("/")] = int(level)
+    return priorities
+
+
+class DownloadJob:
+    """An item that is in the premiumize cloud and waits to be downloaded"""
+
+    def __init__(
+        self,
+        d_id: int,
+        name: str,
+        folder_id: str,
+        category: str,
+        size: int = None,
+        account: str = None,
+        links: list = None,
+    ):
+        self.d_id = d_id
+        self.name = name
+        self.folder_id = folder_id
+        self.category = category
+        self.size = size  # total size of the cloud folder in bytes, None if not known yet
+        self.account = account  # id of the premiumize account the folder is in, None for the primary account
+        self.links = links  # result of get_folder_as_download_links if it was already listed
+
+    def __str__(self):
+        size = f"{self.size / 1024**3:.2f} GB" if self.size is not None else "unknown size"
+        return f"{self.name} ({self.category or '/'}, {size})"
+
+
+class DownloadQueue:
+    """
+    Priority queue for the download stage, ordered by a virtual start time:
+
+        enqueued_at + category_level * PRIORITY_LEVEL_S + size_in_GB * SIZE_PENALTY_S_PER_GB
+
+    Small jobs and preferred categories get a head start, but since the key grows with the enqueue time a big job
+    only waits for a bounded time (aging) and never starves. The key never changes after the push, so a heap works.
+    """
+
+    def __init__(self, priorities: dict[str, int] = None):
+        self.priorities = parse_category_priorities(CATEGORY_PRIORITIES) if priorities is None else priorities
+        self.heap = []
+        self.counter = itertools.count()  # FIFO for equal keys and never compare jobs
+
+    def key(self, job: DownloadJob, enqueued_at: float) -> float:
+        level = self.priorities.get(job.category.strip("/"), 0)
+        size_gb = (job.size or 0) / 1024**3
+        return enqueued_at + level * PRIORITY_LEVEL_S + size_gb * SIZE_PENALTY_S_PER_GB
+
+    def push(self, job: DownloadJob, enqueued_at: float = None):
+        enqueued_at = time.time() if enqueued_at is None else enqueued_at
+        heapq.heappush(self.heap, (self.key(job, enqueued_at), next(self.counter), job))
+
+    def peek(self) -> DownloadJob:
+        return self.heap[0][2]
+
+    def pop(self) -> DownloadJob:
+        return heapq.heappop(self.heap)[2]
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __iter__(self):
+        return (entry[2] for entry in sorted(self.heap))
@@ -1,41 +1,185 @@
+import hashlib
 import os
+from contextlib import nullcontext
 from pySmartDL import SmartDL
 from tenacity import retry, stop_after_attempt as tries, wait_exponential as w_exp
 from src.db import Database
 from src.helper import get_logger, RetryHandler
+from src.progress import ProgressChannel
+from src.segmented_download import SegmentedDownload
 
 logger = get_logger(__name__)
 rh = RetryHandler(logger)
 
+DOWNLOAD_BACKEND = os.getenv("DOWNLOAD_BACKEND", "pysmartdl")  # pysmartdl | native
+# out of order chunks of the native backend are kept until the hashed prefix reaches them, up to this per download
+VERIFY_BUFFER_MB = int(os.getenv("VERIFY_BUFFER_MB", "64"))
+
+
+class IntegrityError(Exception):
+    """The downloaded file does not match the size/checksums of the cloud file"""
+
+    pass
+
+
+class StreamVerifier:
+    """Counts the bytes and updates the checksums of a file while its bytes pass by (one pass, no re-read).
+    Only the algorithms the cloud listing provides a checksum for are computed, the size is always checked."""
+
+    def __init__(self, expected_size: int = None, expected_hashes: dict = None, buffer_mb: int = VERIFY_BUFFER_MB):
+        self.expected_size = expected_size
+        self.expected_hashes = expected_hashes or {}
+        self.size = 0
+        self.hashers = {algo: hashlib.new(algo) for algo in self.expected_hashes}
+        self.pending = {}  # offset -> chunk that arrived ahead of the hashed prefix
+        self.pending_bytes, self.buffer_limit = 0, buffer_mb * 1024 * 1024
+
+    def update(self, chunk: bytes):
+        self.size += len(chunk)
+        for hasher in self.hashers.values():
+            hasher.update(chunk)
+
+    def update_at(self, offset: int, chunk: bytes):
+        """For writers that receive ranges out of order: a chunk ahead of the hashed prefix is kept until the prefix
+        reaches it and then merged in order. Chunks that don't fit into the buffer are left to catch_up."""
+        if offset != self.size:
+            if self.pending_bytes + len(chunk) <= self.buffer_limit:
+                self.pending[offset] = chunk
+                self.pending_bytes += len(chunk)
+            return
+        self.update(chunk)
+        while self.size in self.pending:
+            chunk = self.pending.pop(self.size)
+            self.pending_bytes -= len(chunk)
+            self.update(chunk)
+
+    def catch_up(self, path: str):
+        """Hashes what the stream couldn't: buffered chunks as they come and only the gaps between them (the chunks
+        that didn't fit into the buffer) from the file, it is usually still in the page cache"""
+        if not self.hashers:
+            return
+        with open(path, "rb") as f:
+            while True:
+                if self.size in self.pending:
+                    chunk = self.pending.pop(self.size)
+                    self.pending_bytes -= len(chunk)
+                else:
+                    f.seek(self.size)
+                    chunk = f.read(min([1024 * 1024] + [offset - self.size for offset in self.pending]))
+                    if not chunk:
+                        break
+                self.update_at(self.size, chunk)
+
+    def verify(self, name: str, size: int = None):
+        """Raises an IntegrityError on a mismatch, size overrides the streamed byte count (e.g. from a stat)"""
+        size = self.size if size is None else size
+        if self.expected_size is not None and size != self.expected_size:
+            raise IntegrityError(f"Size mismatch for {name}: got {size} bytes, expected {self.expected_size}")
+        for algo, hasher in self.hashers.items():
+            if hasher.hexdigest().lower() != str(self.expected_hashes[algo]).lower():
+                raise IntegrityError(f"{algo} mismatch for {name}: got {hasher.hexdigest()}")
+
 
 class Downloader:
     """The Downloader"""
 
-    def __init__(self, dest: str, threads: int, db: Database, speed_limit_kb: int = -1):
+    def __init__(
+        self,
+        dest: str,
+        threads: int,
+        db: Database,
+        speed_limit_kb: int = -1,
+        backend=DOWNLOAD_BACKEND,
+        progress: ProgressChannel = None,
+    ):
         self.dest = dest
         self.threads = threads
         self.speed_limit_kb = speed_limit_kb
         self.db = db
+        self.progress = progress
+        assert backend in ["pysmartdl", "native"], f"Unknown download backend: {backend}"
+        self.backend = backend
 
-    def on_fail(self, retry_state):
+    @staticmethod  # tenacity calls the callback with the retry state only
+    def on_fail(retry_state):
         logger.error(f"DOWNLOAD FAILED: After {retry_state.attempt_number} attempts")
-        rh.on_fail(retry_state)
+        rh.on_fail(retry_state)  # re-raises the last exception (e.g. the IntegrityError) to the manager
+
+    def is_complete(self, path: str, size: int = None) -> bool:
+        """A file counts as downloaded if it exists and (if known) has the size of the cloud file"""
+        if not os.path.exists(path):
+            return False
+        if size is not None and os.path.getsize(path) != size:
+            logger.warning(f"Found incomplete file {path} ({os.path.getsize(path)}/{size} bytes) -> re-fetching")
+            os.remove(path)
+            return False
+        return True
 
-    # TODO: this needs to raise an exception, or somehow mark the dl self as failed in the db - reraise not working?
     @retry(
         stop=tries(3), wait=w_exp(min=2, max=10), retry_error_callback=on_fail, before_sleep=rh.on_retry, reraise=True
     )
-    def download(self, url: str, name: str) -> None:
-        if os.path.exists(f"{self.dest}/{name}"):
+    def download(self, url: str, name: str, size: int = None, hashes: dict = None, d_id: int = None) -> None:
+        """Downloads url to self.dest/name and verifies it against the size and checksums of the cloud file.
+        On a mismatch only this file is removed, so the retry re-fetches just this file.
+        The progress of the file is reported for the item d_id (if there is a progress channel)."""
+        if self.is_complete(f"{self.dest}/{name}", size):
             logger.info(f"File already downloaded -> skipping ({self.dest}{name})")
             return
 
         os.makedirs(self.dest, exist_ok=True)
-        downloader = SmartDL(url, self.dest, threads=self.threads, progress_bar=True, timeout=60)
+        if self.backend == "native":
+            dest = self.download_native(url, f"{self.dest}/{name}", StreamVerifier(size, hashes), d_id)
+        else:
+            dest = self.download_pysmartdl(url, StreamVerifier(size, hashes), d_id)
+        logger.info(f"Download completed! File saved to: {dest}")
+        # raise RuntimeError("Download failed") # for testing purposes
+
+    def track(self, d_id: int, name: str, sample):
+        """Reports the progress of a download to the progress channel while the with block runs"""
+        return self.progress.track(d_id, name, sample) if self.progress else nullcontext()
+
+    def download_pysmartdl(self, url: str, verifier: StreamVerifier, d_id: int = None) -> str:
+        # no progress bar, it redraws into the supervisord log several times a second
+        downloader = SmartDL(url, self.dest, threads=self.threads, progress_bar=False, timeout=60)
 
         if self.speed_limit_kb > 0:
             downloader.limit_speed(1024 * self.speed_limit_kb)  # 1024 bytes == 1 KB
 
-        downloader.start()
-        logger.info(f"Download completed! File saved to: {downloader.get_dest()}")
-        # raise RuntimeError("Download failed") # for testing purposes
+        size = verifier.expected_size
+        with self.track(d_id, os.path.basename(downloader.get_dest()), lambda: (downloader.get_dl_size(), size)):
+            downloader.start()
+        self.verify(downloader.get_dest(), verifier)
+        return downloader.get_dest()
+
+    def download_native(self, url: str, dest: str, verifier: StreamVerifier, d_id: int = None) -> str:
+        """Segmented download into a preallocated dest.part, hashed while streaming, renamed once verified"""
+        part = f"{dest}.part"
+        engine = SegmentedDownload(url, part, max_connections=self.threads, speed_limit_kb=self.speed_limit_kb)
+        if verifier.hashers:
+            engine.on_chunk = verifier.update_at
+        try:
+            with self.track(d_id, os.path.basename(dest), lambda: (engine.bytes_done, engine.size)):
+                engine.start()
+            verifier.catch_up(part)
+            verifier.verify(os.path.basename(dest), size=engine.bytes_done)
+        except Exception as e:
+            logger.error(f"Native download of {dest} failed: {e} -> removing the partial file")
+            if os.path.exists(part):
+                os.remove(part)
+            raise
+        os.replace(part, dest)
+        return dest
+
+    def verify(self, path: str, verifier: StreamVerifier):
+        """pySmartDL merges its segments itself, so we don't see the bytes while they stream in:
+        the size comes from a stat and checksums (only if the cloud listing provides any) need one read"""
+        try:
+            if verifier.hashers:
+                with open(path, "rb") as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                        verifier.update(chunk)
+            verifier.verify(os.path.basename(path), size=os.path.getsize(path))
+        except IntegrityError as e:
+            logger.error(f"Integrity check failed: {e} -> removing the file so it gets re-fetched")
+            os.remove(path)
+            raise
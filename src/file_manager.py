@@ -13,8 +13,9 @@ MAX_STATE_RETRY_COUNT = os.getenv("MAX_STATE_RETRY_COUNT", 3)
 
 
 class FileManager:
-    def __init__(self, db: Database):
+    def __init__(self, db: Database, owner: str):
         self.db = db
+        self.owner = owner  # the state is only changed while this worker holds the lease of the item
 
     def move_and_integrate(self, source, dest, id_for_retry=None):
         """Recursively moves/integrates source into dest, overwriting matching files.  If an id_for_retry is provided,
@@ -29,21 +30,20 @@ class FileManager:
                 # we still raise the error so the caller can retry or handle it
 
             logger.error(f"Failed to move s(integrate) {source} into {dest}: {e}, degrading state of id:{id_for_retry}")
-            q = "UPDATE data SET state_retry_count = state_retry_count + 1 WHERE id = ?"
-            self.db.cursor.execute(q, (id_for_retry,))
+            q = "UPDATE data SET state_retry_count = state_retry_count + 1 WHERE id = ? AND lease_owner = ?"
+            if not self.db.cursor.execute(q, (id_for_retry, self.owner)).rowcount:
+                raise StateRetryError(f"Lost the lease of {id_for_retry} while moving it to {dest}")
             self.db.conn.commit()
 
             q = "SELECT nzb_name, state_retry_count FROM data WHERE id = ?"
             name, rt_count = self.db.cursor.execute(q, (id_for_retry,)).fetchone()
             if rt_count >= MAX_STATE_RETRY_COUNT:
                 logger.error(f"State retry count exceeded for {name}, marking as failed")
-                q = "UPDATE data SET state = 'failed' WHERE id = ?"
-                self.db.cursor.execute(q, (id_for_retry,))
-                self.db.conn.commit()
+                self.db.mark_as_failed(id_for_retry, self.owner)
                 raise StateRetryError(f"State retry count exceeded for {name}")
 
             logger.error(f"New state_retry_count is now {rt_count}/{MAX_STATE_RETRY_COUNT} - complete retrying...")
-            self.db.reset_to_found(id_for_retry, state_retry_count_add=1)
+            self.db.reset_to_found(id_for_retry, self.owner, state_retry_count_add=1)
             raise StateRetryError(f"Failed to move and integrate {source} into {dest}: {e}")
 
     @retry(stop=tries(2), wait=w_exp(2), retry_error_callback=rh.on_fail, before_sleep=rh.on_retry)
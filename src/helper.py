@@ -1,29 +1,78 @@
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import threading
 import time as for_logger_time
 from tenacity import RetryError
 from datetime import datetime, UTC, timedelta
 
 CONFIG_PATH = os.getenv("CONFIG_PATH", "/config")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text | json (one object per line, the log viewer can filter on it)
 logging.basicConfig(level=logging.INFO)
 
+_log_queue = queue.SimpleQueue()
+_log_handler = None  # the one QueueHandler all our loggers share
+_log_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """Hands the record over as is, so formatting (incl. tracebacks) happens on the listener thread, not the caller"""
+
+    def prepare(self, record):
+        return record
+
+
+def _shared_log_handler():
+    """
+    One QueueHandler for all loggers, a single listener thread formats the records and writes them to stderr and
+    (through one file descriptor) to the log file. The caller only puts the record into a queue.
+    """
+    global _log_handler  # pylint: disable=global-statement
+    with _log_lock:
+        if _log_handler is None:
+            if LOG_FORMAT == "json":
+                formatter = JsonFormatter()
+            else:
+                formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+            formatter.converter = for_logger_time.gmtime  # get time in UTC
+            formatter.default_time_format = "UTC: %Y-%m-%d %H:%M:%S"
+
+            handler = logging.StreamHandler()
+            handler.setFormatter(formatter)
+
+            os.makedirs(f"{CONFIG_PATH}/log", exist_ok=True)
+            file_handler = logging.FileHandler(f"{CONFIG_PATH}/log/for_webviewer.log")
+            file_handler.setFormatter(formatter)
+
+            listener = logging.handlers.QueueListener(_log_queue, handler, file_handler)
+            listener.start()
+            atexit.register(listener.stop)  # flushes what is still queued
+            _log_handler = LazyQueueHandler(_log_queue)
+        return _log_handler
+
 
 def get_logger(name):
     level = os.getenv("LOG_LEVEL", "INFO")
     logger = logging.getLogger(name)
     if not logger.hasHandlers() or logger.handlers == []:
-        formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-        formatter.converter = for_logger_time.gmtime  # get time in UTC
-        formatter.default_time_format = "UTC: %Y-%m-%d %H:%M:%S"
-
-        handler = logging.StreamHandler()
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
-
-        os.makedirs(f"{CONFIG_PATH}/log", exist_ok=True)
-        file_handler = logging.FileHandler(f"{CONFIG_PATH}/log/for_webviewer.log")
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        logger.addHandler(_shared_log_handler())
+        logger.propagate = False  # the listener already writes to stderr, don't print it twice via the root logger
 
     logger.setLevel(level)
     return logger
@@ -34,12 +83,12 @@ class UTCDateTime:
 
     _time_fmt = "%Y-%m-%d %H:%M:%S"
 
-    def __init__(self, datetime=datetime.now(UTC), offset=timedelta(hours=0), from_str=None):
+    def __init__(self, dt: datetime = None, offset=timedelta(hours=0), from_str=None):
         if from_str:
             self.datetime = datetime.strptime(from_str, self._time_fmt)
             self.datetime = self.datetime.replace(tzinfo=UTC)
         else:
-            self.datetime = datetime
+            self.datetime = dt or datetime.now(UTC)  # not as default value, that is evaluated once at import
         self.datetime += offset
 
     def __str__(self):
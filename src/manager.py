@@ -1,98 +1,373 @@
+import json
 import os
-import shutil
-from time import sleep
-from datetime import timedelta
+import threading
+import uuid
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep, time
 from tenacity import RetryError, retry, stop_after_attempt as tries, wait_exponential as w_exp
-from src.downloader import Downloader
-from src.premiumize_api import PremiumizeAPI
+from src.downloader import Downloader, IntegrityError
+from src.download_queue import DownloadJob, DownloadQueue
+from src.admission import DiskAdmission
+from src.arr_api import ArrNotifier
+from src.profiler import Profiler
+from src.progress import ProgressChannel
+from src.nzb_archive import NzbArchive, sha256_of
+from src.account_pool import Account, AccountPool, parse_api_keys
+from src.premiumize_api import TransItem
+from src.deadlines import DeadlineHeap
 from src.helper import UTCDateTime, RetryHandler, StateRetryError, get_logger
 from src.file_manager import FileManager
 from src.db import Database
 
 logger = get_logger(__name__)
 rh = RetryHandler(logger)
-MAX_RETRY_COUNT = os.getenv("MAX_RETRY_COUNT", 6)
-MAX_CLOUD_DL_MOVE_RETRY_COUNT = os.getenv("MAX_CLOUD_DL_MOVE_RETRY_COUNT", 3)
+MAX_RETRY_COUNT = int(os.getenv("MAX_RETRY_COUNT", "6"))
+MAX_CLOUD_DL_MOVE_RETRY_COUNT = int(os.getenv("MAX_CLOUD_DL_MOVE_RETRY_COUNT", "3"))
+CLOUD_CACHE_VALIDITY_S = int(float(os.getenv("CLOUD_CACHE_VALIDITY_HOURS", "24")) * 3600)
+# several managers can share one DB: every item is leased to one worker, the lease is renewed by a heartbeat and
+# picked up by another worker once it expired (e.g. the worker crashed)
+WORKER_ID = os.getenv("WORKER_ID")  # default: an id generated once and kept in CONFIG_PATH (see load_worker_id)
+LEASE_TTL_S = int(os.getenv("LEASE_TTL_S", "300"))
+DOWNLOAD_CLAIM_AHEAD = int(os.getenv("DOWNLOAD_CLAIM_AHEAD", "0"))  # cloud items a worker claims ahead, 0 = all
+CLEANUP_THREADS = int(os.getenv("CLEANUP_THREADS", "4"))  # parallel cloud deletions of the cleanup stage
+UPLOAD_TIMEOUT_S = 25 * 60  # time a new transfer gets to show progress
+STALL_TIMEOUT_S = 15 * 60  # time a transfer gets for the next progress after the last one
+NEAR_FINISH_POLL_S = int(os.getenv("NEAR_FINISH_POLL_S", "5"))  # poll delay while a transfer is moved to the cloud
+
+
+def is_nearly_finished(item: TransItem) -> bool:
+    """The transfer is done on premiumize's side and its files are moved into the cloud folder"""
+    return item.message == "Moving to cloud" or float(item.progress or 0) >= 1
 
 
 class Manager:
     def __init__(self, api_key: str, paths: tuple, dl_threads: int, dl_speed: int, chk_delay: int):
         self.blackhole_path, self.dl_path, self.done_path, self.config_path = paths
-        self.to_download, self.to_premiumize, self.to_watch = [], [], {}
+        self.to_download, self.to_premiumize, self.to_watch = DownloadQueue(), [], {}
+        # transfer ids are only unique per account, so the watched transfers are keyed by (account id, transfer id)
+        self.deadlines = DeadlineHeap()  # (account id, transfer id) -> stall timeout of the watched transfers
         self.chk_delay = chk_delay
-        premiumize_cloud_root_dir_name = os.getenv("PREMIUMIZE_CLOUD_ROOT_DIR_NAME", "premiumarr")
+        self.root_dir_name = os.getenv("PREMIUMIZE_CLOUD_ROOT_DIR_NAME", "premiumarr")
 
-        self.pm = PremiumizeAPI(api_key)
-        self.dl = Downloader(self.dl_path, dl_threads, dl_speed)
+        self.pool = AccountPool(parse_api_keys(api_key))  # API_KEY can hold several comma separated keys
         self.db = Database(self.config_path)
-        self.fm = FileManager(self.db)
+        self.dl = Downloader(self.dl_path, dl_threads, self.db, dl_speed, progress=ProgressChannel(self.config_path))
+        self.worker_id = WORKER_ID or self.load_worker_id()
+        self.fm = FileManager(self.db, self.worker_id)
+        self.archive = NzbArchive(f"{self.config_path}/archive", self.db)
+        self.admission = DiskAdmission()
+        self.arr = ArrNotifier()
+        self.profiler = Profiler("main")
+        self.heartbeat_thread = None
+        self.cleanup_executor = ThreadPoolExecutor(max_workers=CLEANUP_THREADS, thread_name_prefix="cleanup")
+        self.usage_recorded_at = {}  # account id -> info_at of the last cloud usage written to the DB
+
+        # the cloud checks (account + root folder) run in the background, so the blackhole is scanned right away
+        # the root folder ids live on the accounts of the pool (Account.root_id)
+        self.cloud_ready = threading.Event()
+        self.cloud_checks_thread = None
+        self.stale_queues = set()
+        logger.info("Manager finished init")
+
+    def load_worker_id(self) -> str:
+        """The id generated for this install on its first start. Not the hostname: that of a container changes with
+        every recreate (image update) and the items of the old one would wait LEASE_TTL_S for another owner. Workers
+        that share the config folder have to set WORKER_ID."""
+        path = f"{self.config_path}/worker_id"
+        if not os.path.exists(path):
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                f.write(f"worker-{uuid.uuid4().hex[:12]}\n")
+            os.replace(f"{path}.tmp", path)
+        with open(path, encoding="utf-8") as f:
+            return f.read().strip()
+
+    def meta_keys(self, account: Account):
+        """Keys of the cached account check and root folder id, the primary account keeps the pre-pool keys"""
+        suffix = "" if account.id == self.pool.primary else f":{account.id}"
+        return f"account_check{suffix}", f"cloud_root_id:{self.root_dir_name}{suffix}"
+
+    def start_cloud_checks(self):
+        """Uses the cached account checks and root folder ids while they are valid, otherwise (re)starts the checks
+        of the remaining accounts in the background. The cloud stages of the loop are skipped until at least one
+        account is ready (self.cloud_ready), accounts that aren't ready yet get no new uploads."""
+        pending = [account for account in self.pool if account.root_id is None]
+        if not pending or (self.cloud_checks_thread and self.cloud_checks_thread.is_alive()):
+            return
 
-        self.test_basic_api_connection()
+        for account in list(pending):
+            check_key, root_key = self.meta_keys(account)
+            account_checked = self.db.get_meta(check_key, max_age=CLOUD_CACHE_VALIDITY_S)
+            root_id = self.db.get_meta(root_key, max_age=CLOUD_CACHE_VALIDITY_S)
+            if account_checked and root_id:
+                logger.info(f"Using cached cloud root folder id of account {account.id}: {root_id}")
+                account.root_id = root_id
+                pending.remove(account)
+                self.cloud_ready.set()
+
+        if pending:
+            self.cloud_checks_thread = threading.Thread(
+                target=self.run_cloud_checks, args=(pending,), name="cloud-checks", daemon=True
+            )
+            self.cloud_checks_thread.start()
 
-        self.premiumarr_root_id = self.pm.ensure_directory_exists(premiumize_cloud_root_dir_name)
-        assert self.premiumarr_root_id, "Failed to get root folder ID"
-        logger.info("Manager finished init")
+    def run_cloud_checks(self, accounts: list[Account]):
+        db = Database(self.config_path)  # a commit on the main connection could split one of the loop's transactions
+        for account in accounts:
+            check_key, root_key = self.meta_keys(account)
+            try:
+                self.test_basic_api_connection(account)
+                db.set_meta(check_key, "success")
+
+                root_id = account.api.ensure_directory_exists(self.root_dir_name)
+                assert root_id, "Failed to get root folder ID"
+                db.set_meta(root_key, root_id)
+            except Exception as e:  # pylint: disable=broad-except # the next cycle starts the checks again
+                logger.error(f"Cloud checks of account {account.id} failed: {e} - retrying next cycle ...")
+                continue
+
+            account.root_id = root_id
+            self.cloud_ready.set()
+            logger.info(f"Cloud checks of account {account.id} done, root folder id: {root_id}")
+
+    def invalidate_cloud_cache(self, account: Account):
+        """Forget the cached checks, e.g. when the root folder might have been removed in the cloud"""
+        for key in self.meta_keys(account):
+            self.db.delete_meta(key)
+        account.root_id = None
+        if not any(acc.root_id for acc in self.pool):
+            self.cloud_ready.clear()
 
     @retry(stop=tries(3), wait=w_exp(max=10), retry_error_callback=rh.on_fail, before_sleep=rh.on_retry)
-    def test_basic_api_connection(self):
-        info = self.pm.get_account_info()
-        logger.info(f"Premiumize account info: {info}")
+    def test_basic_api_connection(self, account: Account):
+        info = account.api.get_account_info()
+        logger.info(f"Premiumize account info of {account.id}: {info}")
         assert info["status"] == "success", f"Failed to get account info, check your API key! (ERR: {info})"
 
-    @retry(stop=tries(1), wait=w_exp(max=10), retry_error_callback=rh.on_fail, before_sleep=rh.on_retry)
     def restore_state(self):
-        logger.info("Restoring state ...")
+        """Marks all in memory queues as stale, each one is then rebuilt from the DB right before its stage runs"""
+        logger.info("Restoring state (lazily) ...")
 
-        # handle cases where the transaction was not completed
-        # we can't ... we don't have the transaction id and the folder_id is not set when the transfer errored
-        # or is not done yet.... ignoring for now
+        # side effects that were interrupted are finished by reconcile_intents in the cycle
+        self.stale_queues = {"found", "uploaded", "in premiumize cloud"}
 
-        q = "SELECT full_path, category_path FROM data WHERE state = 'found'"
-        for item in self.db.cursor.execute(q).fetchall():
-            self.to_premiumize.append((item[0], item[1]))
+    def start_heartbeat(self):
+        if self.heartbeat_thread and self.heartbeat_thread.is_alive():
+            return
+        self.heartbeat_thread = threading.Thread(target=self.heartbeat, name="lease-heartbeat", daemon=True)
+        self.heartbeat_thread.start()
 
-        to_watch = "SELECT dl_id, category_path, dl_retry_count FROM data WHERE state = 'uploaded'"
-        for item in self.db.cursor.execute(to_watch).fetchall():
-            dl_id, category_path, dl_retry_count = item
-            self.to_watch[dl_id] = [dl_retry_count, category_path]
+    def heartbeat(self):
+        """Renews the leases of this worker's items every LEASE_TTL_S / 3, on its own connection"""
+        db = Database(self.config_path)
+        while True:
+            try:
+                held = db.renew_leases(self.worker_id, LEASE_TTL_S)
+                db.set_meta(f"worker_heartbeat:{self.worker_id}", str(held))
+                logger.debug("Heartbeat: renewed the leases of %d item(s)", held)
+            except Exception as e:  # pylint: disable=broad-except # the next beat tries again before they expire
+                logger.error(f"Failed to renew the leases: {e}")
+            sleep(LEASE_TTL_S / 3)
+
+    def adopt_unowned_items(self):
+        """Claims items nobody holds a valid lease on, i.e. of a crashed worker or from before leases existed"""
+        states = ["found", "uploaded", "downloaded", "downloaded and online cleaned up"]
+        adopted = self.db.claim(self.worker_id, LEASE_TTL_S, states)
+        for d_id, state in adopted:
+            logger.info(f"Claimed unowned item {d_id} in state '{state}'")
+            self.stale_queues.add(state)
+        if adopted:
+            self.stale_queues.update(states)
+
+    def lease_lost(self, d_id: int):
+        """Another worker claimed the item while this one was busy with it (e.g. stalled for longer than LEASE_TTL_S):
+        the state update was fenced off, the item is dropped from this worker's queues and left to the new owner"""
+        logger.warning(f"Lease of item {d_id} was taken over by another worker, dropping it")
+        self.db.conn.rollback()  # ends the transaction the fenced update opened, it must not hold the write lock
+        row = self.db.cursor.execute("SELECT full_path FROM data WHERE id = ?", (d_id,)).fetchone()
+        self.to_premiumize = [entry for entry in self.to_premiumize if row is None or entry[0] != row[0]]
+        for key in [key for key, (_, _, w_id) in self.to_watch.items() if w_id == d_id]:
+            self.unwatch(key)
+        self.admission.release(d_id)
+
+    def claim_downloads(self):
+        """Claims cloud items for the download stage, with DOWNLOAD_CLAIM_AHEAD only as many as the local queue needs
+        so the other workers get the rest"""
+        limit = DOWNLOAD_CLAIM_AHEAD - len(self.to_download) if DOWNLOAD_CLAIM_AHEAD > 0 else -1
+        if limit == 0 or limit < -1:
+            return
+        claimed = [d_id for d_id, _ in self.db.claim(self.worker_id, LEASE_TTL_S, ["in premiumize cloud"], limit)]
+        if not claimed:
+            return
+
+        q = (
+            "SELECT id, nzb_name, dl_folder_id, category_path, cloud_size, account FROM data "
+            + f"WHERE id IN ({', '.join('?' * len(claimed))})"
+        )
+        for item in self.db.cursor.execute(q, claimed).fetchall():
+            self.to_download.push(DownloadJob(*item))
+        logger.info(f"Claimed {len(claimed)} item(s) for download")
+
+    @retry(stop=tries(1), wait=w_exp(max=10), retry_error_callback=rh.on_fail, before_sleep=rh.on_retry)
+    def restore_queue(self, state: str):
+        if state not in self.stale_queues:
+            return
 
-        to_download = "SELECT id, nzb_name, dl_folder_id, category_path FROM data WHERE state = 'in premiumize cloud'"
-        for item in self.db.cursor.execute(to_download).fetchall():
-            self.to_download.append(((item[0], item[1], item[2]), item[3]))
+        if state == "found":
+            q = "SELECT full_path, category_path FROM data WHERE state = 'found' AND lease_owner = ?"
+            self.to_premiumize = [(item[0], item[1]) for item in self.db.cursor.execute(q, (self.worker_id,))]
+        elif state == "uploaded":
+            q = (
+                "SELECT id, dl_id, category_path, dl_retry_count, account, cld_dl_timeout_time FROM data "
+                + "WHERE state = 'uploaded' AND lease_owner = ?"
+            )
+            self.to_watch, self.deadlines = {}, DeadlineHeap()
+            for d_id, dl_id, category, retry_c, account, timeout_at in self.db.cursor.execute(q, (self.worker_id,)):
+                key = (self.pool.get(account).id, dl_id)
+                self.to_watch[key] = [retry_c, category, d_id]
+                self.deadlines.schedule_epoch(key, timeout_at or int(time()) + STALL_TIMEOUT_S)
+        elif state == "in premiumize cloud":
+            q = (
+                "SELECT id, nzb_name, dl_folder_id, category_path, cloud_size, account "
+                + "FROM data WHERE state = 'in premiumize cloud' AND lease_owner = ?"
+            )
+            self.to_download = DownloadQueue()
+            for item in self.db.cursor.execute(q, (self.worker_id,)).fetchall():
+                self.to_download.push(DownloadJob(*item))
+
+        self.stale_queues.discard(state)
+        logger.info(f"Restored queue for state '{state}'")
+
+    def reconcile_intents(self):
+        """
+        Finishes the side effects this worker's items were in the middle of when a worker stopped (crash, kill) or
+        lost their lease, going by the intent journal: an upload that reached premiumize is picked up as its
+        transfer instead of being uploaded again, files that were completely moved to done complete the item
+        instead of degrading it to 'found' (a full re-download). Anything else is left to the stages, they resume
+        from the DB state.
+        """
+        intents = self.db.get_pending_intents(self.worker_id)
+        if not intents:
+            return
+        logger.info(f"Reconciling {len(intents)} unfinished intent(s) ...")
+
+        uploads = [i for i in intents if i["kind"] == "upload" and i["state"] == "found"]
+        transfers, polled = [], set()
+        if uploads:
+            try:
+                transfers, polled = self.pool.get_transfers({i["payload"]["account"] for i in uploads})
+            except Exception as e:  # pylint: disable=broad-except # the intents are kept for the next start
+                logger.error(f"Could not get the transfers to reconcile the uploads: {e}")
+
+        for intent in intents:
+            if intent["kind"] == "upload" and intent in uploads:
+                if intent["payload"]["account"] in polled:
+                    self.reconcile_upload(intent, transfers)
+            elif intent["kind"] == "move_to_done" and intent["state"] == "downloaded and online cleaned up":
+                self.reconcile_move(intent)
+            else:  # the item moved on (or was reset) after the side effect, nothing to resume
+                self.db.complete_intent(intent["id"])
+
+    def reconcile_upload(self, intent: dict, transfers: list):
+        d_id, payload = intent["d_id"], intent["payload"]
+        name = payload["nzb_name"].removesuffix(".nzb")
+        for item in transfers:
+            # premiumize names the transfer after the NZB without the .nzb suffix
+            if item.account != payload["account"] or item.name.removesuffix(".nzb") != name:
+                continue
+            q = "SELECT 1 FROM data WHERE dl_id = ? AND COALESCE(account, ?) = ?"
+            if self.db.cursor.execute(q, (item.id, self.pool.primary, item.account)).fetchone():
+                continue  # the transfer of another item with the same NZB name
+            logger.info(f"Upload of {payload['nzb_name']} reached premiumize before the stop, watching {item.id}")
+            q = (
+                "UPDATE data SET state = 'uploaded', dl_id = ?, cld_dl_timeout_time = ?, account = ? "
+                + "WHERE id = ? AND lease_owner = ?"
+            )
+            timeout_at = int(time()) + UPLOAD_TIMEOUT_S
+            if self.db.cursor.execute(q, (item.id, timeout_at, item.account, d_id, self.worker_id)).rowcount:
+                self.db.complete_intent(intent["id"])
+                self.stale_queues.update({"found", "uploaded"})
+            else:  # the new owner reconciles it
+                self.lease_lost(d_id)
+            return
+        logger.info(f"Upload of {payload['nzb_name']} never reached premiumize, it is uploaded again")
+        self.db.complete_intent(intent["id"])
 
-        logger.info("Restored state!")
+    def reconcile_move(self, intent: dict):
+        d_id, src, dst = intent["d_id"], intent["payload"]["src"], intent["payload"]["dst"]
+        if os.path.exists(src) or not os.path.exists(dst):  # move_to_done moves the rest (or handles the loss)
+            self.db.complete_intent(intent["id"])
+            return
+        logger.info(f"Files of item {d_id} were moved to {dst} before the stop, completing it")
+        q = "UPDATE data SET state = 'done', done_at = ? WHERE id = ? AND lease_owner = ?"
+        if not self.db.cursor.execute(q, (UTCDateTime().str(), d_id, self.worker_id)).rowcount:
+            self.lease_lost(d_id)
+            return
+        self.db.complete_intent(intent["id"])
+        category, nzb_full_path = self.db.cursor.execute(
+            "SELECT category_path, full_path FROM data WHERE id = ?", (d_id,)
+        ).fetchone()
+        self.arr.notify_imported(category.strip("/"), dst)
+        if os.path.exists(nzb_full_path):
+            self.archive.store(nzb_full_path, d_id)
 
     @retry(stop=tries(6), wait=w_exp(min=5, max=120), retry_error_callback=rh.on_fail, before_sleep=rh.on_retry)
     def run(self):
         self.restore_state()
-        logger.info(f"Starting manager loop ... with check delays of {self.chk_delay}s")
+        self.start_heartbeat()
+        self.start_cloud_checks()
+        logger.info(f"Starting manager loop as worker '{self.worker_id}' ... with check delays of {self.chk_delay}s")
 
         while True:
-            logger.debug("Checking for incoming NZBs ...")
-            self.check_folder_for_incoming_nzbs()
-
+            with self.profiler.cycle():  # only does something while a cProfile capture is running
+                self.run_cycle()
+
+            delay = self.deadlines.seconds_until_next(self.chk_delay)  # wake up early for a transfer timeout
+            logger.info(f"Done with one complete check cycle! Sleeping for {delay:.0f}s ...")
+            if self.cloud_ready.is_set():
+                sleep(delay)
+            else:  # the cloud stages start as soon as the first account is ready, not after the full delay
+                self.cloud_ready.wait(delay)
+
+    def run_cycle(self):
+        self.adopt_unowned_items()
+        self.reconcile_intents()  # of a crash before this start or of a worker whose items were taken over
+
+        logger.debug("Checking for incoming NZBs ...")
+        self.restore_queue("found")
+        self.check_folder_for_incoming_nzbs()
+
+        self.start_cloud_checks()  # no-op once all accounts are ready
+        if self.cloud_ready.is_set():
             logger.debug("Uploading NZBs to premiumize downloader ...")
             self.upload_nzbs_to_premiumize_downloader()
 
             logger.debug("Checking for finished cloud downloads ...")
+            self.restore_queue("uploaded")
             self.check_premiumize_downloader_state()
 
             logger.debug("Checking if there are files to download to local ...")
+            self.restore_queue("in premiumize cloud")
+            self.claim_downloads()
             self.download_files_from_premiumize()
 
             logger.debug("Checking if there are files to clean up in the cloud ...")
             self.cleanup_online_files()
+            self.record_cloud_usage()
+        else:
+            logger.info("Cloud checks not finished yet, skipping the cloud stages this cycle ...")
 
-            logger.debug("Checking if there are files to move to done folder ...")
-            self.move_to_done()
-
-            logger.info(f"Done with one complete check cycle! Sleeping for {self.chk_delay}s ...")
-            sleep(self.chk_delay)
+        logger.debug("Checking if there are files to move to done folder ...")
+        self.move_to_done()
+        self.arr.flush()
 
     @retry(stop=tries(5), wait=w_exp(2, max=30), retry_error_callback=rh.on_fail, before_sleep=rh.on_retry)
     def move_to_done(self):
-        q = "SELECT id, nzb_name, category_path, full_path FROM data WHERE state = 'downloaded and online cleaned up'"
-        items = self.db.cursor.execute(q).fetchall()
+        q = (
+            "SELECT id, nzb_name, category_path, full_path FROM data "
+            + "WHERE state = 'downloaded and online cleaned up' AND lease_owner = ?"
+        )
+        items = self.db.cursor.execute(q, (self.worker_id,)).fetchall()
         for item in items:
             d_id, d_name, category, nzb_full_path = item
             category = category[1:] if category.startswith("/") else category  # normalize category path
@@ -100,65 +375,163 @@ class Manager:
             logger.info(f"Moving files to done folder for {d_name} ...")
             try:
                 src, dst = f"{self.dl_path}/{d_name}", f"{self.done_path}/{category}/{d_name}"
+                intent = self.db.begin_intent(d_id, "move_to_done", {"src": src, "dst": dst})
                 self.fm.move_and_integrate(src, dst, d_id)
-                done_at = UTCDateTime().str()
-                self.db.cursor.execute("UPDATE data SET state = 'done', done_at = ? WHERE id = ?", (done_at, d_id))
-                self.db.conn.commit()
+                q = "UPDATE data SET state = 'done', done_at = ? WHERE id = ? AND lease_owner = ?"
+                if not self.db.cursor.execute(q, (UTCDateTime().str(), d_id, self.worker_id)).rowcount:
+                    self.lease_lost(d_id)  # the intent stays, the new owner finishes the item from it
+                    continue
+                self.db.complete_intent(intent)
+                self.admission.release(d_id)
+                self.arr.notify_imported(category, dst)
                 logger.info(f"COMPLETED {d_name}")
             except Exception as e:
+                self.admission.release(d_id)  # re-reserved when it is admitted for download again
                 self.restore_state()  # state could be updated on error case
                 raise e  # reraise the exception to retry this move step
 
             # if the nzb file can't be moved we don't want to retry the whole process...
-            self.fm.move_and_integrate(nzb_full_path, f"{self.config_path}/archive/{d_name}")  # the nzb file
+            try:
+                self.archive.store(nzb_full_path, d_id)
+            except OSError as e:
+                raise RetryError(f"Failed to archive {nzb_full_path}: {e}") from e
 
     @retry(stop=tries(3), wait=w_exp(2, min=5, max=45), retry_error_callback=rh.on_fail, before_sleep=rh.on_retry)
     def cleanup_online_files(self):
-        q = "SELECT id, dl_id, nzb_name FROM data WHERE state = 'downloaded'"
-        for item in self.db.cursor.execute(q).fetchall():
-            d_id, dl_id, d_name = item
-            logger.info(f"Removing files from premiumize cloud for {d_name} ...")
-            try:
-                self.pm.delete_transfer(dl_id)
-            except RetryError as e:
-                logger.error(f"Failed to delete transfer: {e}\n  Assuming it was already deleted ...")
+        """
+        Removes the transfers of all downloaded items and their folders in the cloud (premiumize keeps the folder
+        when the transfer is deleted, the cloud space would fill up), the items are cleaned up concurrently and
+        their state is updated in one go.
+        """
+        q = "SELECT id, dl_id, dl_folder_id, nzb_name, account FROM data WHERE state = 'downloaded' AND lease_owner = ?"
+        rows = self.db.cursor.execute(q, (self.worker_id,)).fetchall()
+        # without the root folder id a single file transfer's folder (the root) can't be told apart, the items of an
+        # account whose cloud checks aren't done (again) wait for them
+        items = [item for item in rows if self.pool.get(item[4]).root_id]
+        if len(items) < len(rows):
+            logger.info(f"Holding the cleanup of {len(rows) - len(items)} item(s) until the cloud checks are done")
+        if not items:
+            return
 
-            self.db.cursor.execute("UPDATE data SET state = 'downloaded and online cleaned up' WHERE id = ?", (d_id,))
-            self.db.conn.commit()
+        logger.info(f"Removing {len(items)} item(s) from premiumize cloud ...")
+        futures = [(item, self.cleanup_executor.submit(self.cleanup_item, *item)) for item in items]
+        cleaned = []
+        for item, future in futures:  # one failed item must not keep the others from their state update
+            try:
+                cleaned.append(future.result())
+            except Exception as e:  # pylint: disable=broad-except # it stays 'downloaded' for the next cycle
+                logger.error(f"Failed to remove {item[3]} from premiumize cloud: {e} - trying again next cycle")
+        if not cleaned:
+            return
+        q = (
+            "UPDATE data SET state = 'downloaded and online cleaned up' "
+            + f"WHERE id IN ({', '.join('?' * len(cleaned))}) AND lease_owner = ? RETURNING id"
+        )
+        updated = {row[0] for row in self.db.cursor.execute(q, (*cleaned, self.worker_id)).fetchall()}
+        self.db.conn.commit()
+        for d_id in set(cleaned) - updated:
+            self.lease_lost(d_id)
+        for account in {self.pool.get(item[4]) for item in items}:
+            account.info_at = 0  # the freed space shows up in the next account info
+
+    def cleanup_item(self, d_id: int, dl_id: str, folder_id: str, d_name: str, account_id: str) -> int:
+        """Runs in the cleanup threads, only talks to the API (the DB connection stays in the main thread)"""
+        account = self.pool.get(account_id)
+        root_id = account.root_id  # the cloud cache can be invalidated while this runs
+        try:
+            account.api.delete_transfer(dl_id)
+        except (RetryError, RuntimeError, requests.RequestException) as e:
+            logger.error(f"Failed to delete transfer of {d_name}: {e}\n  Assuming it was already deleted ...")
+
+        if root_id is None:
+            logger.warning(f"Keeping the cloud folder of {d_name}, the root folder of account {account.id} is unknown")
+        elif folder_id and folder_id != root_id:  # single file transfers have no folder of their own
+            try:
+                account.api.delete_folder(folder_id)
+            except (RetryError, RuntimeError, requests.RequestException) as e:
+                logger.error(f"Failed to delete cloud folder of {d_name}: {e}\n  Assuming it was already deleted ...")
+        logger.info(f"Removed {d_name} from premiumize cloud")
+        return d_id
+
+    def record_cloud_usage(self):
+        """Writes the cloud space and fair use of every account to the meta table (the webserver's /metrics)"""
+        self.pool.refresh_info()
+        for account in self.pool:
+            if not account.info or self.usage_recorded_at.get(account.id) == account.info_at:
+                continue
+            usage = {
+                "space_used": account.space_used(),
+                "space_used_bytes": float(account.info.get("space_used") or 0),
+                "limit_used": float(account.info.get("limit_used") or 0),
+            }
+            self.db.set_meta(f"cloud_usage:{account.id}", json.dumps(usage))
+            self.usage_recorded_at[account.id] = account.info_at
 
     @retry(stop=tries(2), wait=w_exp(10, min=5, max=45), retry_error_callback=rh.on_fail, before_sleep=rh.on_retry)
     def download_files_from_premiumize(self):
         while self.to_download:
-            (d_id, d_name, d_folder_id), category = self.to_download[0]
+            job = self.to_download.peek()
+            d_id, d_name = job.d_id, job.name
             try:
-                category = category[1:] if category.startswith("/") else category  # normalize category path
-                links_and_paths: list[tuple[str, str]] = self.get_folder_as_download_links(d_folder_id, d_name)
-                for link, path, name in links_and_paths:
+                if job.links is None:
+                    job.links = self.get_folder_as_download_links(job.folder_id, d_name, job.account)
+                    job.size = sum(size for _, _, _, size, _ in job.links)
+
+                category = job.category[1:] if job.category.startswith("/") else job.category
+                dl_target, done_target = f"{self.dl_path}/{d_name}", f"{self.done_path}/{category}/{d_name}"
+                if not self.admission.try_reserve(d_id, job.size, dl_target, done_target):
+                    logger.warning(f"Holding {len(self.to_download)} download(s) until there is space for {job}")
+                    return
+
+                logger.info(f"Next download (of {len(self.to_download)} queued): {job}")
+                for link, path, name, size, hashes in job.links:
                     self.dl.dest = f"{self.dl_path}/{path}"
                     logger.info(f'Downloading: "{self.dl_path}/{path}/{name}" from {link[:40]}...')
-                    self.dl.download(url=link, name=name)
+                    self.dl.download(url=link, name=name, size=size, hashes=hashes, d_id=d_id)
 
                 logger.info(f"Downloaded all files from {d_name} ...")
                 logger.info(f"Removing the transfer from premiumize cloud and downloader for {d_name} ...")
 
-                q = "UPDATE data SET state = 'downloaded' WHERE id = ?"
-            except StateRetryError as e:  # only on StateRetryError we degrade the state
+                q = "UPDATE data SET state = 'downloaded' WHERE id = ? AND lease_owner = ?"
+            except (StateRetryError, IntegrityError) as e:  # only then we degrade the state (and pop the job)
+                # a file that still mismatches after the download's retries is broken in the cloud, a new transfer
+                # is the only way to get it, retrying it every cycle would block the queue behind it
                 logger.error(f"Failed to download files: {e}\n  degrading state to 'found'")
-                q = "UPDATE data SET state = 'found' WHERE id = ?"
+                q = "UPDATE data SET state = 'found' WHERE id = ? AND lease_owner = ?"
+                self.stale_queues.add("found")  # reload the upload queue so the item gets uploaded again
+                self.admission.release(d_id)
 
-            self.db.cursor.execute(q, (d_id,))
+            lost = not self.db.cursor.execute(q, (d_id, self.worker_id)).rowcount
             self.db.conn.commit()
-            self.to_download.pop(0)
+            self.db.clear_progress(d_id)
+            self.to_download.pop()
+            if lost:
+                self.lease_lost(d_id)
+
+    def create_download_job(self, d_id: int, name: str, folder_id: str, category: str, account: str) -> DownloadJob:
+        """Lists the cloud folder right away, the size orders the download queue and the download reuses the links"""
+        try:
+            links = self.get_folder_as_download_links(folder_id, name, account)
+        except StateRetryError as e:  # the download stage lists again (and degrades the state if it still fails)
+            logger.warning(f"Could not list cloud folder of {name} yet: {e}")
+            return DownloadJob(d_id, name, folder_id, category, account=account)
+
+        size = sum(size for _, _, _, size, _ in links)
+        self.db.set_cloud_size(d_id, size)
+        return DownloadJob(d_id, name, folder_id, category, size, account, links)
 
     @retry(stop=tries(3), wait=w_exp(2, min=5, max=20), retry_error_callback=rh.on_state_fail, before_sleep=rh.on_retry)
-    def get_folder_as_download_links(self, f_id: str, path: str = "") -> list[tuple[str, str, str]]:
+    def get_folder_as_download_links(
+        self, f_id: str, path: str = "", account: str = None
+    ) -> list[tuple[str, str, str, int, dict]]:
+        """Returns (link, path, name, size, hashes) for every file in the folder (recursively)"""
         ret = []
-        folder = self.pm.list_folder(f_id)
+        folder = self.pool.api(account).list_folder(f_id)
         for item in folder.content:
             if item.is_folder():
-                ret.extend(self.get_folder_as_download_links(item.id, f"{path}/{item.name}"))
+                ret.extend(self.get_folder_as_download_links(item.id, f"{path}/{item.name}", account))
             elif item.is_file():
-                ret.append((item.link, f"{path}", item.name))
+                ret.append((item.link, f"{path}", item.name, item.size, item.hashes))
 
         return ret
 
@@ -166,6 +539,7 @@ class Manager:
     # that way I would not need to use a mutex to prevent others from modifying the list
     @retry(stop=tries(3), wait=w_exp(max=10), retry_error_callback=rh.on_fail, before_sleep=rh.on_retry)
     def check_folder_for_incoming_nzbs(self):
+        lease_expires = int(time()) + LEASE_TTL_S
         for root, _, files in os.walk(self.blackhole_path):
             for file in files:
                 full_file_path = f"{root}/{file}"
@@ -177,12 +551,27 @@ class Manager:
                 if file.endswith(".nzb"):
                     category_path = root[len(self.blackhole_path) :]
                     logger.info(f'Found new NZB file: "{file}" in subfolder: "{category_path}"')
-
-                    self.db.cursor.execute(
-                        "INSERT INTO data (nzb_name, state, full_path, category_path) VALUES (?, ?, ?, ?)",
-                        (file, "found", full_file_path, category_path),
-                    )
+                    try:  # before the upload changes it, the archive is keyed by it
+                        sha256 = sha256_of(full_file_path)
+                    except OSError:  # e.g. removed again, the upload finds out
+                        sha256 = None
+                    archived = self.archive.lookup(sha256) if sha256 else None  # before this item links to it
+
+                    # atomic check and insert, another worker might scan the same blackhole
+                    inserted = self.db.cursor.execute(
+                        "INSERT INTO data (nzb_name, state, full_path, category_path, lease_owner, lease_expires, "
+                        + "nzb_sha256) SELECT ?, 'found', ?, ?, ?, ?, ? "
+                        + "WHERE NOT EXISTS (SELECT 1 FROM data WHERE full_path = ?)",
+                        (file, full_file_path, category_path, self.worker_id, lease_expires, sha256, full_file_path),
+                    ).rowcount
                     self.db.conn.commit()
+                    if not inserted:
+                        continue
+                    if archived:  # e.g. the *arr grabbed it again after the files were deleted
+                        logger.info(
+                            f"{file} was processed before (archived as {sha256[:12]}, last item "
+                            + f"{archived['d_id']}: {archived['state']}) - processing it again"
+                        )
 
                     self.to_premiumize.append((full_file_path, category_path))
                 else:
@@ -191,37 +580,66 @@ class Manager:
     @retry(stop=tries(3), wait=w_exp(min=2, max=30), retry_error_callback=rh.on_fail, before_sleep=rh.on_retry)
     def upload_nzbs_to_premiumize_downloader(self):
         while self.to_premiumize:
+            account = self.pool.pick_for_upload()
+            if account is None:
+                logger.warning(f"No account has a free transfer slot and quota left, holding {len(self.to_premiumize)}")
+                return
+
             try:
                 nzb_path, category_path = self.to_premiumize[0]
-                logger.info(f"Uploading NZB file: {nzb_path} ...")
-
-                dl_id = self.pm.upload_nzb(nzb_path, self.premiumarr_root_id)
-                cld_dl_timeout_time = UTCDateTime(offset=timedelta(minutes=25)).str()
-
-                q = "UPDATE data SET state = 'uploaded', dl_id = ?, cld_dl_timeout_time = ? WHERE full_path = ?"
-                self.db.cursor.execute(q, (dl_id, cld_dl_timeout_time, nzb_path))
-                self.db.conn.commit()
+                logger.info(f"Uploading NZB file: {nzb_path} to {account} ...")
+
+                d_id = self.db.cursor.execute("SELECT id FROM data WHERE full_path = ?", (nzb_path,)).fetchone()[0]
+                payload = {"nzb_name": os.path.basename(nzb_path), "account": account.id}
+                intent = self.db.begin_intent(d_id, "upload", payload)  # a crash after the upload finds the transfer
+                dl_id = account.api.upload_nzb(nzb_path, account.root_id)
+                self.pool.note_upload(account)
+                timeout_at = int(time()) + UPLOAD_TIMEOUT_S  # epoch
+
+                q = (
+                    "UPDATE data SET state = 'uploaded', dl_id = ?, cld_dl_timeout_time = ?, account = ? "
+                    + "WHERE id = ? AND lease_owner = ?"
+                )
+                lost = not self.db.cursor.execute(q, (dl_id, timeout_at, account.id, d_id, self.worker_id)).rowcount
+                self.db.complete_intent(intent)  # commits the state together with the completion
+                if lost:  # the new owner uploads it itself, don't leave a second transfer behind
+                    self.lease_lost(d_id)
+                    try:
+                        account.api.delete_transfer(dl_id)
+                    except (RetryError, RuntimeError, requests.RequestException) as e:
+                        logger.error(f"Failed to delete the transfer {dl_id} of {nzb_path}: {e}")
+                    continue
 
-                self.to_watch[dl_id] = [0, category_path]
+                self.to_watch[(account.id, dl_id)] = [0, category_path, d_id]
+                self.deadlines.schedule((account.id, dl_id), UPLOAD_TIMEOUT_S)
                 self.to_premiumize.pop(0)
                 logger.info(f"Uploaded NZB file: {nzb_path}")
+            except (RuntimeError, RetryError) as e:  # e.g. the cached root folder was deleted in the cloud
+                logger.error(f"Failed to upload {nzb_path}: {e} - re-validating the cloud root folder ...")
+                self.invalidate_cloud_cache(account)
+                raise e
             except FileNotFoundError:  # this is a critical error, we can't recover from this
                 logger.error(f"PERMANENTLY FAILED: File was never found: {nzb_path}")
                 # if the file is gone we will never be able to upload it, but technically this should not doom the nzb
                 # file itself since if we had it we could try to process it ->
                 # TODO:  notify sonarr to request it again (without marking it as forbidden)
                 # for now we just mark it as failed
-                q = "UPDATE data SET state = 'failed' WHERE full_path = ?"
-                self.db.cursor.execute(q, (nzb_path,))
+                q = "UPDATE data SET state = 'failed' WHERE full_path = ? AND lease_owner = ?"
+                self.db.cursor.execute(q, (nzb_path, self.worker_id))
                 self.db.conn.commit()
                 self.to_premiumize.pop(0)
 
+    def unwatch(self, key: tuple):
+        self.to_watch.pop(key)
+        self.deadlines.cancel(key)
+        self.deadlines.cancel(("poll", key))
+
     @retry(stop=tries(3), wait=w_exp(min=2, max=30), retry_error_callback=rh.on_fail, before_sleep=rh.on_retry)
     def check_premiumize_downloader_state(self):
         if len(self.to_watch) == 0:  # nothing to watch, so don't bother the API
             return
 
-        transfers = self.pm.get_transfers()
+        transfers, polled = self.pool.get_transfers({account for account, _ in self.to_watch})
         # # single transfer item:
         # folder_id = None
         # id = 'abcAbcAbcAbc'
@@ -233,100 +651,128 @@ class Manager:
 
         retry_cases = ["deleted", "banned", "error", "timeout"]
 
-        # filter the transfers that are in the waiting list
-        filtered_ours = [item for item in transfers if item.id in self.to_watch]
+        # filter the transfers that are in the waiting list (transfer ids are only unique per account)
+        filtered_ours = [item for item in transfers if (item.account, item.id) in self.to_watch]
         filtered_finished = [item for item in filtered_ours if item.status == "finished"]
         filtered_failed = [item for item in filtered_ours if item.status in retry_cases]
         filtered_waiting = [item for item in filtered_ours if item not in filtered_finished + filtered_failed]
-        somehow_lost_ids = [item for item in self.to_watch if not any(item == x.id for x in filtered_ours)]
+        ours = {(item.account, item.id) for item in filtered_ours}
+        somehow_lost_keys = [key for key in self.to_watch if key[0] in polled and key not in ours]
 
         for item in filtered_finished:
-            category_path = self.to_watch[item.id][1]
+            key = (item.account, item.id)
+            _, category_path, d_id = self.to_watch[key]
 
-            self.db.cursor.execute("SELECT id FROM data WHERE dl_id = ?", (item.id,))  # I much rather use the id
-            d_id = self.db.cursor.fetchone()[0]
-
-            q = "UPDATE data SET state = 'in premiumize cloud', dl_folder_id = ? WHERE id = ?"
-            self.db.cursor.execute(q, (item.folder_id, d_id))
+            q = (
+                "UPDATE data SET state = 'in premiumize cloud', dl_folder_id = ? WHERE id = ? AND lease_owner = ? "
+                + "RETURNING nzb_name"
+            )
+            row = self.db.cursor.execute(q, (item.folder_id, d_id, self.worker_id)).fetchone()
             self.db.conn.commit()
+            if row is None:
+                self.lease_lost(d_id)
+                continue
 
-            self.to_download.append(((d_id, item.name, item.folder_id), category_path))
-            logger.info(f"Added item to download list: {item}")
-
-            self.to_watch.pop(item.id)
+            # download into the NZB's name like the restored jobs, move_to_done and cleanup expect it there (the
+            # transfer is named without .nzb)
+            (nzb_name,) = row
+            job = self.create_download_job(d_id, nzb_name, item.folder_id, category_path, item.account)
+            if DOWNLOAD_CLAIM_AHEAD > 0:  # hand it over, the download goes to whichever worker has capacity
+                self.db.release_lease(d_id)
+            else:
+                self.to_download.push(job)
+                logger.info(f"Added item to download list: {item}")
+
+            self.unwatch(key)
             logger.info(f"Removed item from watch list: {item}")
 
         for item in filtered_failed:
-            self.to_watch[item.id][0] += 1  # increase retry_count
-            q = "SELECT id, full_path FROM data WHERE dl_id = ?"
-            d_id, full_path = self.db.cursor.execute(q, (item.id,)).fetchone()
+            key = (item.account, item.id)
+            self.to_watch[key][0] += 1  # increase retry_count
+            d_id = self.to_watch[key][2]
+            full_path = self.db.cursor.execute("SELECT full_path FROM data WHERE id = ?", (d_id,)).fetchone()[0]
             self.db.increment_dl_retry_count(d_id)
 
-            cur_retry_count = self.to_watch[item.id][0]
+            cur_retry_count = self.to_watch[key][0]
 
             if cur_retry_count >= MAX_RETRY_COUNT:
                 # TODO: Do we really want to handle this here already?
-                logger.error(f'premiumize failed for: "{item}", notifying sonarr (NOT IMPL. YET)...')  # TODO: IMPL.
-                self.db.mark_as_failed(d_id)
+                logger.error(f'premiumize failed for: "{item}", notifying the *arr ...')
+                if not self.db.mark_as_failed(d_id, self.worker_id):
+                    self.lease_lost(d_id)
+                    continue
+                self.arr.report_failed(self.to_watch[key][1], item.name)
                 # TODO: Add a stage where nzbs for failed items are deleted and also from the cloud
                 try:
-                    self.pm.delete_transfer(item.id)
-                    shutil.move(full_path, f"{self.config_path}/archive/{item.name}")  # move the nzb to the archive
+                    self.pool.api(item.account).delete_transfer(item.id)
+                    self.archive.store(full_path, d_id)
                 except (FileNotFoundError, RetryError) as e:
                     logger.error(f"Failed to delete/Remove transfer/NZB: {e}\n  Assuming it was already deleted ...")
 
-                self.to_watch.pop(item.id)
+                self.unwatch(key)
                 continue
 
             logger.warning(f"Item failed to download ({cur_retry_count}/{MAX_RETRY_COUNT}): retrying ... {item}")
-            self.pm.retry_transfer(item.id)  # unknown errors are resolvable by retrying on premiumize downloader
+            # unknown errors are resolvable by retrying on premiumize downloader
+            self.pool.api(item.account).retry_transfer(item.id)
 
         # Print the status of the transfers that are still in progress
         for item in filtered_waiting:
+            key = (item.account, item.id)
             # get item infos:
             q = (
                 "SELECT id, cld_dl_timeout_time, cld_dl_move_retry_c, full_path, category_path, message "
-                + "FROM data WHERE dl_id = ?"
+                + "FROM data WHERE id = ?"
             )
-            d_id, c_dc_timeout_time, cld_dl_move_retry_c, full_pth, cat_pth, last_message = self.db.cursor.execute(
-                q, (item.id,)
+            d_id, timeout_at, cld_dl_move_retry_c, full_pth, cat_pth, last_message = self.db.cursor.execute(
+                q, (self.to_watch[key][2],)
             ).fetchone()
+            if key not in self.deadlines:  # e.g. the timeout was never set
+                self.deadlines.schedule_epoch(key, timeout_at or int(time()) + STALL_TIMEOUT_S)
 
             # check first 3 chars e.g. 12%( of...), 100(% of...), Mov(ing to cloud)
-            if str(item.message)[0:3] != last_message[0:3]:  # progress was made
-                new_timeout_time = UTCDateTime(offset=timedelta(minutes=15)).str()
-                c_dc_timeout_time = new_timeout_time
-                self.db.set_message_and_timeout_time(d_id, item.message, new_timeout_time)
+            if str(item.message)[0:3] != str(last_message)[0:3]:  # progress was made (message is NULL after a reset)
+                self.db.set_message_and_timeout_time(d_id, item.message, int(time()) + STALL_TIMEOUT_S)
+                self.deadlines.schedule(key, STALL_TIMEOUT_S)
 
-            if UTCDateTime() > UTCDateTime(from_str=c_dc_timeout_time):
+            if self.deadlines.is_due(key):
                 if item.message != "Moving to cloud":  # stuck in smth. else? e.g. 'Waiting for free upload slot' ?
                     logger.error(f"Transfer stuck: {item.name} at unexpected state '{item.message}' !PLS REPORT THAT!")
                     continue
 
                 logger.error(f"TRANSFER TIMED OUT: {item.name}")
                 if cld_dl_move_retry_c >= MAX_CLOUD_DL_MOVE_RETRY_COUNT:
-                    logger.error(f"Cloud move retries exceeded for {item.name}, notifying sonarr (NOT IMPL. YET) ...")
+                    logger.error(f"Cloud move retries exceeded for {item.name}, notifying the *arr ...")
                     # mark it as failed
-                    self.db.mark_as_failed(d_id)
-                    self.to_watch.pop(item.id)
+                    if not self.db.mark_as_failed(d_id, self.worker_id):
+                        self.lease_lost(d_id)
+                        continue
+                    self.arr.report_failed(cat_pth, item.name)
+                    self.unwatch(key)
                     continue
-                    # TODO: IMPL. notify sonarr
 
-                self.pm.delete_transfer(item.id)  # remove the transfer from the cloud
+                self.pool.api(item.account).delete_transfer(item.id)  # remove the transfer from the cloud
                 # reset the state so it will be uploaded again but increase the retry count
-                self.db.reset_to_found(d_id, cld_dl_move_retry_c_add=1)
-                self.to_watch.pop(item.id)  # remove the transfer from the watch list
+                if not self.db.reset_to_found(d_id, self.worker_id, cld_dl_move_retry_c_add=1):
+                    self.lease_lost(d_id)
+                    continue
+                self.unwatch(key)  # remove the transfer from the watch list
                 self.to_premiumize.append((full_pth, cat_pth))  # add it to the DL list again
                 continue
 
+            if is_nearly_finished(item):  # check again soon instead of after chk_delay
+                self.deadlines.schedule(("poll", key), NEAR_FINISH_POLL_S)
+
             logger.info("In progress:")
             logger.info(f'  name:"{item.name}", msg: "{item.message}"')
 
-        for transfer_id in somehow_lost_ids:
-            q = "SELECT id, nzb_name, full_path, category_path FROM data WHERE dl_id = ?"
-            d_id, name, full_path, category_path = self.db.cursor.execute(q, (transfer_id,)).fetchone()
+        for key in somehow_lost_keys:
+            q = "SELECT id, nzb_name, full_path, category_path FROM data WHERE id = ?"
+            d_id, name, full_path, category_path = self.db.cursor.execute(q, (self.to_watch[key][2],)).fetchone()
 
             logger.error(f"Transfer LOST: {name} was lost! Increasing retry count ...")
-            self.db.reset_to_found(d_id, cld_dl_move_retry_c_add=1)
-            self.to_watch.pop(transfer_id)  # remove the transfer from the watch list
+            if not self.db.reset_to_found(d_id, self.worker_id, cld_dl_move_retry_c_add=1):
+                self.lease_lost(d_id)
+                continue
+            self.unwatch(key)  # remove the transfer from the watch list
             self.to_premiumize.append((full_path, category_path))
@@ -0,0 +1,61 @@
+import io
+import os
+import uuid
+import zlib
+
+CHUNK_SIZE = 64 * 1024
+
+
+class MultipartStream:
+    """
+    multipart/form-data body of some form fields and one file that is read from the file while it is sent, so an
+    upload never holds more than one chunk of the file in memory (requests' files= builds the whole body first).
+    It is file-like with a length, requests sends it with a Content-Length and reads it in blocks.
+    """
+
+    def __init__(self, fields: dict, file_field: str, file, file_name: str = None):
+        self.boundary = uuid.uuid4().hex
+        file_name = (file_name or os.path.basename(file.name)).replace('"', "%22")
+        head = b"".join(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+            for name, value in fields.items()
+            if value is not None  # like requests' data=, e.g. no folder_id -> the root folder
+        )
+        head += (
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{file_name}"\r\n'
+            + "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode()
+        tail = f"\r\n--{self.boundary}--\r\n".encode()
+        file_size = os.fstat(file.fileno()).st_size - file.tell()
+        self.length = len(head) + file_size + len(tail)
+        self.parts = [io.BytesIO(head), file, io.BytesIO(tail)]
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size: int = -1) -> bytes:
+        size = CHUNK_SIZE if size is None or size < 0 else size  # never the whole body at once
+        chunk = b""
+        while self.parts and len(chunk) < size:
+            data = self.parts[0].read(size - len(chunk))
+            if not data:
+                self.parts.pop(0)
+            chunk += data
+        return chunk
+
+    def __iter__(self):
+        while chunk := self.read(CHUNK_SIZE):
+            yield chunk
+
+
+def gzip_stream(stream, chunk_size: int = CHUNK_SIZE):
+    """Compresses a body on the fly (Content-Encoding: gzip), the length is unknown so it goes out chunked"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 16 + 15 -> gzip container
+    while chunk := stream.read(chunk_size):
+        if data := compressor.compress(chunk):
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,83 @@
+import gzip
+import hashlib
+import os
+import tempfile
+from src.db import Database
+from src.helper import get_logger
+
+logger = get_logger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_of(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class NzbArchive:
+    """
+    Content-addressed store of the processed NZBs in CONFIG_PATH/archive: every NZB is gzipped (it's XML, ~10x
+    smaller) to ab/cd/<sha256>.nzb.gz, so the same NZB is stored once no matter its name and no directory gets
+    huge. The nzb_archive table indexes the stored files, data.nzb_sha256 links the items to them.
+
+    An item's NZB is keyed by the hash it had when it was found (data.nzb_sha256): upload_nzb appends spaces to get
+    past premiumize's duplicate check, the same NZB grabbed again must still match.
+    """
+
+    def __init__(self, root: str, db: Database):
+        self.root = root
+        self.db = db
+
+    def path_of(self, sha256: str) -> str:
+        return f"{self.root}/{sha256[:2]}/{sha256[2:4]}/{sha256}.nzb.gz"
+
+    def store(self, src: str, d_id: int = None) -> str:
+        """Moves the NZB at src into the archive (hashed and compressed in one pass), returns its key"""
+        os.makedirs(self.root, exist_ok=True)
+        found_as = self.db.get_nzb_sha256(d_id) if d_id is not None else None
+        hasher, size = hashlib.sha256(), 0
+        with open(src, "rb") as f:
+            fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+            try:
+                with open(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as gz:
+                    for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                        hasher.update(chunk)
+                        size += len(chunk)
+                        gz.write(chunk)
+                sha256 = found_as or hasher.hexdigest()
+                dest = self.path_of(sha256)
+                if os.path.exists(dest):  # the same NZB was archived before (e.g. under another name)
+                    os.remove(tmp)
+                else:
+                    os.makedirs(os.path.dirname(dest), exist_ok=True)
+                    os.replace(tmp, dest)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+
+        self.db.add_archived_nzb(sha256, os.path.basename(src), size, os.path.getsize(dest), d_id)
+        os.remove(src)
+        logger.info(f"Archived {os.path.basename(src)} as {sha256[:12]} ({size} -> {os.path.getsize(dest)} bytes)")
+        return sha256
+
+    def lookup(self, sha256: str) -> dict:
+        """The index entry of an archived NZB, None if it was never archived"""
+        return self.db.get_archived_nzb(sha256)
+
+    def import_flat_files(self):
+        """Migration: older versions moved the NZBs as they were to archive/<name>"""
+        if not os.path.isdir(self.root):
+            return
+        flat = [entry.path for entry in os.scandir(self.root) if entry.is_file() and entry.name.endswith(".nzb")]
+        for path in flat:
+            try:
+                self.store(path)
+            except OSError as e:
+                logger.error(f"Failed to archive {path}: {e}")
+        if flat:
+            logger.info(f"Moved {len(flat)} NZB(s) of the old flat archive into the content-addressed archive")
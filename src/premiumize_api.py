@@ -3,11 +3,16 @@ import random
 import requests
 from tenacity import retry, stop_after_attempt as tries, wait_exponential as w_exp, RetryError
 from src.helper import RetryHandler, get_logger
+from src.multipart import MultipartStream, gzip_stream
 
 logger = get_logger(__name__)
 rh = RetryHandler(logger)
 
-BASE_URL = "https://www.premiumize.me/api"  # https://app.swaggerhub.com/apis-docs/premiumize.me/api
+# https://app.swaggerhub.com/apis-docs/premiumize.me/api, overridable e.g. to point at bench/premiumize_stub.py
+BASE_URL = os.getenv("PREMIUMIZE_API_URL", "https://www.premiumize.me/api")
+SUPPORTED_HASHES = ["md5", "sha1", "sha256"]  # checksum fields a file listing might carry
+# gzip compresses the NZB uploads on the fly (Content-Encoding: gzip), only for an API that accepts compressed bodies
+UPLOAD_COMPRESSION = os.getenv("UPLOAD_COMPRESSION", "none")
 # IMPROVEMENT IDEA: Add a check for "Network error" and busy wait till the network is back up
 #                   This concept might be called circuit breaker
 
@@ -16,7 +21,7 @@ class FolderFileResponse:
     """
     Class to represent a folder or file response from the API
     Only id, name, type, created_at are guaranteed to be present (for folders and files)
-    For files you can also expect size, link and directlink
+    For files you can also expect size, link and directlink, hashes holds any checksums the API sent (hashlib names)
     """
 
     def __init__(self, data: dict):
@@ -31,6 +36,7 @@ class FolderFileResponse:
             self.size = data["size"]
             self.directlink = data["directlink"]
             self.link = data["link"]
+            self.hashes = {algo: data[algo] for algo in SUPPORTED_HASHES if data.get(algo)}
 
     def is_folder(self):
         return self.type == "folder"
@@ -87,6 +93,9 @@ class TransItem:
     def __str__(self):
         return str(vars(self))
 
+    def __repr__(self):
+        return self.__str__()
+
 
 class PremiumizeAPI:
     def __init__(self, api_key: str):
@@ -102,7 +111,8 @@ class PremiumizeAPI:
         if resp.status != "success":
             raise RetryError(f"Failed to get transfer list: {resp}")
         assert isinstance(resp, TransferListResponse), f"Expected type transfer_list_response, got {type(resp)}"
-        logger.debug(f"Got {len(resp.transfers)} transfers\n  {resp.transfers}")
+        # lazy %-formatting: the whole list is only turned into a string if debug logging is on
+        logger.debug("Got %d transfers\n  %s", len(resp.transfers), resp.transfers)
         return resp.transfers
 
     @retry(stop=tries(3), wait=w_exp(2, max=20), retry_error_callback=rh.on_fail, before_sleep=rh.on_retry)
@@ -123,10 +133,12 @@ class PremiumizeAPI:
     def list_root_folder(self):
         return FolderListResponse(self._get("/folder/list"))
 
-    # unused
     @retry(stop=tries(3), wait=w_exp(2, max=20), retry_error_callback=rh.on_fail, before_sleep=rh.on_retry)
     def delete_folder(self, f_id: str):
-        return self._post("/folder/delete", data={"id": f_id})
+        result = self._post("/folder/delete", data={"id": f_id})
+        if result["status"] != "success":
+            raise RetryError(f"Failed to delete folder: {result}")
+        return result
 
     # unused
     @retry(stop=tries(3), wait=w_exp(2, max=20), retry_error_callback=rh.on_fail, before_sleep=rh.on_retry)
@@ -178,6 +190,21 @@ class PremiumizeAPI:
             raise RuntimeError(f"Request failed with status code {response.status_code}, {response.text}")
         return response.json()
 
+    def _post_file(self, url: str, data: dict, field: str, f):
+        """Like _post with files=, but the multipart body is streamed from the file (constant memory)"""
+        url = BASE_URL + url if url.startswith("/") else url
+        f.seek(0)
+        body = MultipartStream({**data, "apikey": self.api_key}, field, f)
+        headers = {"Content-Type": body.content_type}
+        if UPLOAD_COMPRESSION == "gzip":
+            headers["Content-Encoding"] = "gzip"
+            body = gzip_stream(body)
+
+        response = requests.post(url, data=body, headers=headers, timeout=90)
+        if response.status_code != 200:
+            raise RuntimeError(f"Request failed with status code {response.status_code}, {response.text}")
+        return response.json()
+
     @retry(stop=tries(5), wait=w_exp(max=60), retry_error_callback=rh.on_fail, before_sleep=rh.on_retry)
     def ensure_directory_exists(self, directory: str) -> None:
         resp = self.create_folder(directory)
@@ -215,14 +242,13 @@ class PremiumizeAPI:
     def upload_nzb(self, nzb_path: str, target_folder_id: str):
         with open(nzb_path, "r+b") as f:
             logger.info(f"Uploading {nzb_path} to premiumize downloader ...")
-            resp = self._post("/transfer/create", data={"folder_id": target_folder_id}, files={"file": f})
+            resp = self._post_file("/transfer/create", {"folder_id": target_folder_id}, "file", f)
 
             while self.expect_fail_msg(resp, "You have already added this nzb file."):
                 logger.warning("Already uploaded this nzb... circumventing the duplicate check, free retry!")
                 f.seek(0, os.SEEK_END)  # seek to the end of the file
                 f.write(b" " * random.randint(1, 100))  # append spaces to circumvent the premiumize duplicate check
-                f.seek(0)
-                resp = self._post("/transfer/create", data={"folder_id": target_folder_id}, files={"file": f})
+                resp = self._post_file("/transfer/create", {"folder_id": target_folder_id}, "file", f)
 
             assert "id" in resp, f"Failed to upload nzb (missing id): {resp}"
             u_id = resp["id"]
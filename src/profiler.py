@@ -0,0 +1,176 @@
+import cProfile
+import json
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from src.helper import get_logger
+
+logger = get_logger(__name__)
+
+CONFIG_PATH = os.getenv("CONFIG_PATH", "/config")
+PROFILE_SECONDS = int(os.getenv("PROFILE_SECONDS", "30"))
+PROFILE_INTERVAL_MS = int(os.getenv("PROFILE_INTERVAL_MS", "10"))  # stack sampling interval
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")  # the web route is disabled without a token
+MAX_PROFILE_SECONDS = 600
+MODES = ["sample", "cprofile"]
+
+
+def profile_dir() -> str:
+    return f"{CONFIG_PATH}/profiles"
+
+
+def request_path(process: str) -> str:
+    """Where the parameters of a capture requested by another process (the web route) are put before the signal"""
+    return f"{profile_dir()}/{process}.request.json"
+
+
+def pid_path(process: str) -> str:
+    return f"{profile_dir()}/{process}.pid"
+
+
+def request_capture(process: str, mode: str, seconds: int) -> str:
+    """Asks another process (that called Profiler.install) for a capture, returns where the output will be"""
+    with open(pid_path(process), encoding="utf-8") as f:
+        pid = int(f.read())
+    with open(request_path(process), "w", encoding="utf-8") as f:
+        json.dump({"mode": mode, "seconds": seconds}, f)
+    os.kill(pid, signal.SIGUSR1)
+    return f"{profile_dir()}/{process}-*"
+
+
+class Profiler:
+    """
+    On-demand profiling of a running process, nothing runs (and nothing is hooked) until a capture is triggered by
+    SIGUSR1 (stack samples), SIGUSR2 (cProfile) or start():
+
+    - sample: a thread records the stacks of all other threads every PROFILE_INTERVAL_MS and writes them in the
+      collapsed format (one 'thread;outer;...;inner count' line per stack, for flamegraph.pl/speedscope/inferno)
+    - cprofile: the code inside cycle() (the Manager.run loop) is profiled with cProfile, the stats are written as
+      .prof (snakeviz, flameprof, pstats) and as a text summary
+
+    The output lands in CONFIG_PATH/profiles/<process>-<UTC time>.<ext>.
+    """
+
+    def __init__(self, process: str):
+        self.process = process
+        self.lock = threading.Lock()
+        self.running = None  # mode of the current capture
+        self.cprofile = None  # set while a cProfile capture is active, checked by cycle()
+        self.cycle_done = threading.Event()  # set whenever a profiled cycle ends
+        self.cycle_done.set()
+        self.cycle_profiled = threading.Event()  # a complete cycle was profiled during the current capture
+
+    def install(self):
+        """Registers the signal handlers (main thread only) and the pid file the web route uses"""
+        os.makedirs(profile_dir(), exist_ok=True)
+        with open(pid_path(self.process), "w", encoding="utf-8") as f:
+            f.write(str(os.getpid()))
+        signal.signal(signal.SIGUSR1, lambda *_: self.on_signal("sample"))
+        signal.signal(signal.SIGUSR2, lambda *_: self.on_signal("cprofile"))
+        logger.info(f"Profiler ready: kill -USR1 {os.getpid()} (stack samples) / -USR2 (cProfile)")
+
+    def on_signal(self, mode: str):
+        seconds = PROFILE_SECONDS
+        try:  # a request from the web route overrides the defaults
+            with open(request_path(self.process), encoding="utf-8") as f:
+                requested = json.load(f)
+            os.remove(request_path(self.process))
+            mode, seconds = requested.get("mode", mode), int(requested.get("seconds", seconds))
+        except (OSError, ValueError):
+            pass
+        # don't do the work in the signal handler, it interrupts whatever the main thread was doing
+        threading.Thread(target=self.start, args=(mode, seconds), name="profiler", daemon=True).start()
+
+    def start(self, mode: str = "sample", seconds: int = PROFILE_SECONDS) -> str:
+        """Runs a capture (blocking) and returns the path of its output, None if another capture is running"""
+        assert mode in MODES, f"Unknown profile mode: {mode}, expected one of {MODES}"
+        with self.lock:
+            if self.running:
+                logger.warning(f"Profiler: a {self.running} capture is already running, ignoring the request")
+                return None
+            self.running = mode
+
+        base = f"{profile_dir()}/{self.process}-{time.strftime('%Y%m%d-%H%M%S', time.gmtime())}"
+        logger.info(f"Profiler: capturing {seconds}s ({mode}) to {base}.* ...")
+        try:
+            os.makedirs(profile_dir(), exist_ok=True)
+            if mode == "sample":
+                path = self.write_samples(f"{base}.folded", self.sample(seconds))
+            else:
+                path = self.write_cprofile(base, self.capture_cprofile(seconds))
+        finally:
+            with self.lock:
+                self.running = None
+        logger.info(f"Profiler: wrote {path}")
+        return path
+
+    def sample(self, seconds: int) -> Counter:
+        stacks = Counter()
+        me = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():  # pylint: disable=protected-access
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stacks[";".join([names.get(ident, str(ident))] + stack[::-1])] += 1
+            time.sleep(PROFILE_INTERVAL_MS / 1000)
+        return stacks
+
+    def write_samples(self, path: str, stacks: Counter) -> str:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")  # the count is separated by the last space
+        return path
+
+    def capture_cprofile(self, seconds: int) -> cProfile.Profile:
+        """cProfile only sees the thread that enabled it, so cycle() of the profiled loop enables it itself. The
+        loop sleeps between its cycles, so the capture is extended until at least one cycle was profiled."""
+        profile = cProfile.Profile()
+        self.cycle_profiled.clear()
+        self.cprofile = profile
+        time.sleep(seconds)
+        if not self.cycle_profiled.is_set():
+            logger.info("Profiler: no loop cycle ran yet, extending the cProfile capture until one did ...")
+            self.cycle_profiled.wait(MAX_PROFILE_SECONDS)
+        self.cprofile = None
+        self.cycle_done.wait()  # a cycle that started during the capture is profiled until its end
+        return profile
+
+    @contextmanager
+    def cycle(self):
+        """Wrap one loop iteration, profiled only while a cProfile capture is active (otherwise one None check)"""
+        profile = self.cprofile
+        if profile is None:
+            yield
+            return
+        self.cycle_done.clear()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.cycle_profiled.set()
+            self.cycle_done.set()
+
+    def write_cprofile(self, base: str, profile: cProfile.Profile) -> str:
+        try:
+            stats = pstats.Stats(profile)
+        except TypeError:  # no cycle ran during the capture (e.g. one long sleep)
+            logger.warning("Profiler: no loop cycle ran during the cProfile capture, nothing to write")
+            return None
+        stats.dump_stats(f"{base}.prof")
+        with open(f"{base}.txt", "w", encoding="utf-8") as f:
+            stats.stream = f
+            stats.sort_stats("cumulative").print_stats(60)
+        return f"{base}.prof"
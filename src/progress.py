@@ -0,0 +1,65 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from src.db import Database
+from src.helper import get_logger
+
+logger = get_logger(__name__)
+
+PROGRESS_INTERVAL_S = float(os.getenv("PROGRESS_INTERVAL_S", "5"))  # how often the local download progress is saved
+
+
+class ProgressChannel:
+    """
+    Samples the running local downloads (bytes done, speed, ETA of the current file of an item) every
+    PROGRESS_INTERVAL_S and writes them to the progress table, where the webserver picks them up for
+    /api/current_state and /metrics. The sampling runs in its own thread with its own DB connection, the download
+    only registers a function that returns (bytes done, total bytes) via track().
+    """
+
+    def __init__(self, config_path: str, interval: float = PROGRESS_INTERVAL_S):
+        self.config_path = config_path
+        self.interval = interval
+        self.lock = threading.Lock()  # held while sampling, so nothing is written for a download after track()
+        self.tracked = {}  # d_id -> [file name, sample function, last bytes done, last sample time]
+        self.thread = None
+
+    @contextmanager
+    def track(self, d_id: int, name: str, sample):
+        if d_id is None:  # e.g. the download benchmark
+            yield
+            return
+        self.start()
+        with self.lock:
+            self.tracked[d_id] = [name, sample, 0, time.monotonic()]
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.tracked.pop(d_id, None)
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self.run, name="progress", daemon=True)
+            self.thread.start()
+
+    def run(self):
+        db = Database(self.config_path)  # sqlite connections must not be shared between threads
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                for d_id, entry in self.tracked.items():
+                    try:
+                        self.sample(db, d_id, entry)
+                    except Exception as e:  # pylint: disable=broad-except # progress must never stop a download
+                        logger.debug("Could not sample the progress of %s: %s", d_id, e)
+
+    def sample(self, db: Database, d_id: int, entry: list):
+        name, sample, last_bytes, last_time = entry
+        bytes_done, total = sample()
+        now = time.monotonic()
+        speed = max(0, int((bytes_done - last_bytes) / (now - last_time))) if now > last_time else 0
+        eta = int((total - bytes_done) / speed) if speed and total else None
+        entry[2:] = [bytes_done, now]
+        db.set_progress(d_id, name, bytes_done, total or None, speed, eta)
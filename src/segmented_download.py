@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+import requests
+from src.helper import get_logger
+
+logger = get_logger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+MIN_SPLIT_SIZE = 4 * 1024 * 1024  # don't split ranges smaller than this into a new connection
+RAMP_UP_INTERVAL = 0.5  # seconds between throughput measurements when deciding whether to add a connection
+RAMP_UP_GAIN = 1.10  # a new connection has to add at least 10% aggregate throughput to keep growing
+
+
+class Segment:
+    """A byte range [start, end] of the target file, pos is the next byte to write. end can shrink when another
+    connection takes over the tail of the range"""
+
+    def __init__(self, start: int, end: int):
+        self.start = start
+        self.end = end
+        self.pos = start
+
+    def remaining(self):
+        return self.end - self.pos + 1
+
+
+class SegmentedDownload:
+    """
+    Multi-range HTTP download straight into a preallocated file.
+
+    Every connection writes its range at the right offset with os.pwrite, so there are no segment files to merge
+    and every byte is written exactly once. It starts with half of max_connections and keeps adding one (by
+    splitting the biggest remaining range) while that raises the aggregate throughput, up to max_connections.
+    """
+
+    def __init__(self, url: str, path: str, max_connections: int = 4, speed_limit_kb: int = -1, timeout: int = 60):
+        self.url = url
+        self.path = path
+        self.max_connections = max(1, max_connections)
+        self.speed_limit = speed_limit_kb * 1024 if speed_limit_kb > 0 else None
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        self.segments: list[Segment] = []
+        self.errors: list[Exception] = []
+        self.worker_exited = threading.Event()
+        self.size = None
+        self.bytes_done = 0
+        self.started_at = None
+        self.on_chunk = None  # optional callback(offset, chunk) called in order of arrival, under self.lock
+
+    def probe(self):
+        """Returns (size, accepts_ranges) of the remote file"""
+        resp = self.session.get(self.url, headers={"Range": "bytes=0-0"}, stream=True, timeout=self.timeout)
+        resp.close()
+        if resp.status_code == 206 and "Content-Range" in resp.headers:
+            return int(resp.headers["Content-Range"].rsplit("/", 1)[1]), True
+        resp.raise_for_status()
+        length = resp.headers.get("Content-Length")
+        return (int(length) if length is not None else None), False
+
+    def start(self):
+        """Downloads the file, blocking until it is done. Raises the first error of any connection."""
+        self.size, ranges = self.probe()
+        self.started_at = time.monotonic()
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if self.size:
+                self._preallocate(fd, self.size)
+            if not ranges or not self.size:
+                self._fetch(fd, Segment(0, (self.size or 0) - 1), ranged=False)
+            else:
+                self._run_segmented(fd)
+            if self.errors:
+                raise self.errors[0]
+        finally:
+            os.close(fd)
+            self.session.close()
+
+    def _preallocate(self, fd: int, size: int):
+        try:
+            os.posix_fallocate(fd, 0, size)  # reserves the blocks, fails early if the disk is full
+        except (AttributeError, OSError):  # not available on every platform / filesystem
+            os.ftruncate(fd, size)
+
+    def _run_segmented(self, fd: int):
+        self.segments = [Segment(0, self.size - 1)]
+        threads = [self._start_worker(fd, self.segments[0])]
+        target, best_rate, last_bytes, last_time = (self.max_connections + 1) // 2, 0.0, 0, time.monotonic()
+
+        while any(t.is_alive() for t in threads):
+            now = time.monotonic()
+            if now - last_time >= RAMP_UP_INTERVAL:
+                rate = (self.bytes_done - last_bytes) / (now - last_time)
+                last_bytes, last_time = self.bytes_done, now
+                if rate > best_rate * RAMP_UP_GAIN and target < self.max_connections:
+                    target += 1  # the last connection paid off, try one more
+                best_rate = max(best_rate, rate)
+
+            # grow to the target and replace connections that finished their range (work stealing)
+            alive = sum(t.is_alive() for t in threads)
+            while alive < target and not self.errors:
+                segment = self._split_biggest()
+                if not segment:
+                    break
+                logger.debug("Starting connection #%d for %s at %.1f MB/s", alive + 1, self.path, best_rate / 1024**2)
+                threads.append(self._start_worker(fd, segment))
+                alive += 1
+
+            self.worker_exited.wait(RAMP_UP_INTERVAL)  # wakes up early when a connection is done
+            self.worker_exited.clear()
+
+        # connections whose range got split finish early, make sure nothing is left over
+        for segment in self.segments:
+            if segment.remaining() > 0 and not self.errors:
+                self._fetch(fd, segment, ranged=True)
+
+    def _start_worker(self, fd: int, segment: Segment) -> threading.Thread:
+        thread = threading.Thread(target=self._worker, args=(fd, segment), daemon=True)
+        thread.start()
+        return thread
+
+    def _worker(self, fd: int, segment: Segment):
+        try:
+            self._fetch(fd, segment, ranged=True)
+        except Exception as e:  # pylint: disable=broad-except # handed over to the calling thread
+            with self.lock:
+                self.errors.append(e)
+        finally:
+            self.worker_exited.set()
+
+    def _split_biggest(self):
+        """Takes the upper half of the biggest remaining range and returns it as a new segment"""
+        with self.lock:
+            biggest = max(self.segments, key=Segment.remaining)
+            if biggest.remaining() < 2 * MIN_SPLIT_SIZE:
+                return None
+            middle = biggest.pos + biggest.remaining() // 2
+            segment = Segment(middle, biggest.end)
+            biggest.end = middle - 1
+            self.segments.append(segment)
+            return segment
+
+    def _fetch(self, fd: int, segment: Segment, ranged: bool, retries: int = 3):
+        for attempt in range(1, retries + 1):
+            try:
+                return self._stream(fd, segment, ranged)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == retries or not ranged:
+                    raise
+                logger.warning(f"Connection error at byte {segment.pos} of {self.path}: {e} - resuming ...")
+
+    def _stream(self, fd: int, segment: Segment, ranged: bool):
+        headers = {"Range": f"bytes={segment.pos}-{segment.end}"} if ranged else {}
+        with self.session.get(self.url, headers=headers, stream=True, timeout=self.timeout) as resp:
+            resp.raise_for_status()
+            if ranged and resp.status_code != 206:
+                raise RuntimeError(f"Server ignored the range request for {self.url} (HTTP {resp.status_code})")
+
+            for chunk in resp.iter_content(CHUNK_SIZE):
+                with self.lock:
+                    if ranged:
+                        chunk = chunk[: max(0, segment.end - segment.pos + 1)]  # the range might have been split
+                    if not chunk:
+                        break
+                    offset = segment.pos
+                    segment.pos += len(chunk)
+                    self.bytes_done += len(chunk)
+                    if self.on_chunk:
+                        self.on_chunk(offset, chunk)
+                os.pwrite(fd, chunk, offset)
+                self._throttle()
+
+    def _throttle(self):
+        if not self.speed_limit:
+            return
+        expected_time = self.bytes_done / self.speed_limit
+        elapsed = time.monotonic() - self.started_at
+        if expected_time > elapsed:
+            time.sleep(expected_time - elapsed)
@@ -1,10 +1,21 @@
 import os
+import gzip
+import hashlib
+import hmac
+import json
 import logging
-from flask import Flask, jsonify, request, render_template
+import re
+import threading
+from time import monotonic
+from flask import Flask, Response, jsonify, request, render_template
 from src.db import Database
+from src.profiler import MAX_PROFILE_SECONDS, MODES, PROFILE_SECONDS, PROFILE_TOKEN, Profiler, request_capture
 from prometheus_client import generate_latest, CollectorRegistry, CONTENT_TYPE_LATEST, Gauge, Info
 
 CONFIG_PATH = os.getenv("CONFIG_PATH", "/config")
+API_CACHE_TTL_S = float(os.getenv("API_CACHE_TTL_S", "30"))  # upper bound, a DB change invalidates right away
+GZIP_MIN_BYTES = 1024  # smaller payloads aren't worth compressing
+MAX_CACHED_RESPONSES = 256
 
 app = Flask(__name__)
 app.config["DEBUG"] = False  # Flask debugging
@@ -13,6 +24,44 @@ app.config["DEBUG"] = False  # Flask debugging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 db = Database(CONFIG_PATH)
+profiler = Profiler("webserver")
+response_cache = {}  # full request path -> (data_version, created_at, etag, body, gzipped body)
+response_cache_lock = threading.Lock()
+
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    """If-None-Match holds '*' or comma separated entity tags, weak ones (W/"...") match by their opaque tag"""
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in [tag.removeprefix("W/") for tag in tags]
+
+
+def cached_json(build):
+    """
+    Serves build() as JSON for the polling dashboard. The serialized (and gzipped) body is reused as long as the
+    DB data_version didn't change (at most API_CACHE_TTL_S), so an unchanged poll doesn't query anything. The ETag is
+    a hash of the body, a client that already has it gets a 304 without a body.
+    """
+    key = request.full_path
+    version = db.get_data_version()
+    with response_cache_lock:
+        entry = response_cache.get(key)
+    if entry is None or entry[0] != version or monotonic() - entry[1] > API_CACHE_TTL_S:
+        body = app.json.dumps(build()).encode()
+        gzipped = gzip.compress(body, compresslevel=6) if len(body) >= GZIP_MIN_BYTES else None
+        entry = (version, monotonic(), f'"{hashlib.sha1(body).hexdigest()[:20]}"', body, gzipped)
+        with response_cache_lock:
+            if len(response_cache) >= MAX_CACHED_RESPONSES:  # e.g. a client walking through many offsets
+                response_cache.clear()
+            response_cache[key] = entry
+
+    _, _, etag, body, gzipped = entry
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}  # no-cache = revalidate
+    if etag_matches(etag, request.headers.get("If-None-Match", "")):
+        return Response(status=304, headers=headers)
+    if gzipped and "gzip" in request.headers.get("Accept-Encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        body = gzipped
+    return Response(body, mimetype="application/json", headers=headers)
 
 
 @app.route("/")
@@ -28,8 +77,7 @@ def index():
 @app.route("/api/current_state")
 def current_state():
     try:
-        data = db.get_current_state()
-        return jsonify(data)
+        return cached_json(db.get_current_state)
     except Exception as e:
         logger.error(f"Error fetching current state: {e}")
         return jsonify({"error": "Error fetching current state"}), 500
@@ -40,8 +88,7 @@ def done_failed():
     try:
         limit = int(request.args.get("limit", 10))
         offset = int(request.args.get("offset", 0))
-        data = db.get_done_failed_entries(limit=limit, offset=offset)
-        return jsonify(data)
+        return cached_json(lambda: db.get_done_failed_entries(limit=limit, offset=offset))
     except Exception as e:
         logger.error(f"Error fetching done/failed entries: {e}")
         return jsonify({"error": "Error fetching done/failed entries"}), 500
@@ -60,6 +107,20 @@ def metrics():
         db_size_in_KB = Gauge("db_size_in_KB", "Size of the database file in KB", registry=registry)
         last_added_UTC = Info("last_added_UTC", "Timestamp of the last added entry", registry=registry)
         last_done_UTC = Info("last_done_UTC", "Timestamp of the last done entry", registry=registry)
+        cloud_space_used = Gauge(
+            "cloud_space_used", "Share of the cloud space in use per account (0..1)", ["account"], registry=registry
+        )
+        cloud_space_used_bytes = Gauge(
+            "cloud_space_used_bytes", "Cloud space in use per account in bytes", ["account"], registry=registry
+        )
+        cloud_fair_use_used = Gauge(
+            "cloud_fair_use_used", "Share of the fair use limit used per account (0..1)", ["account"], registry=registry
+        )
+        labels = ["id", "file"]
+        dl_bytes_done = Gauge("download_bytes_done", "Bytes of the file downloaded so far", labels, registry=registry)
+        dl_bytes_total = Gauge("download_bytes_total", "Size of the file being downloaded", labels, registry=registry)
+        dl_speed = Gauge("download_speed_bytes", "Download speed in bytes per second", labels, registry=registry)
+        dl_eta = Gauge("download_eta_seconds", "Estimated seconds until the file is done", labels, registry=registry)
 
         total_entries.set(db.get_total_entries_count())
         done_entries.set(db.get_done_entries_count())
@@ -73,6 +134,20 @@ def metrics():
         db_size_in_KB.set(db.get_db_size_in_KB())
         last_added_UTC.info({"timestamp": str(db.get_last_added_timestamp())})
         last_done_UTC.info({"timestamp": str(db.get_last_done_timestamp())})
+        for account, usage in db.get_meta_by_prefix("cloud_usage:").items():  # written by the manager
+            usage = json.loads(usage)
+            cloud_space_used.labels(account=account).set(usage["space_used"])
+            if "space_used_bytes" in usage:  # recorded by older versions without it
+                cloud_space_used_bytes.labels(account=account).set(usage["space_used_bytes"])
+            cloud_fair_use_used.labels(account=account).set(usage["limit_used"])
+        for progress in db.get_progress():  # written by the manager while it downloads
+            item = {"id": progress["d_id"], "file": progress["file"]}
+            dl_bytes_done.labels(**item).set(progress["bytes_done"] or 0)
+            dl_speed.labels(**item).set(progress["speed"] or 0)
+            if progress["total"] is not None:
+                dl_bytes_total.labels(**item).set(progress["total"])
+            if progress["eta"] is not None:
+                dl_eta.labels(**item).set(progress["eta"])
 
         data = generate_latest(registry)
         return data, 200, {"Content-Type": CONTENT_TYPE_LATEST}
@@ -81,26 +156,98 @@ def metrics():
         return "Error generating metrics", 500
 
 
+LOG_LINE = re.compile(r"^UTC: \S+ \S+ - (?P<logger>\S+) - (?P<level>[A-Z]+) - ")
+
+
+def read_log_entries(max_bytes: int) -> list[dict]:
+    """
+    The newest log entries (newest first) from the tail of the log file, text and json (LOG_FORMAT) lines are both
+    understood. Lines of a multi line message (e.g. a traceback) stay together with their entry.
+    """
+    log_file_path = os.path.join(CONFIG_PATH, "log", "for_webviewer.log")
+    with open(log_file_path, "r", encoding="utf-8", errors="ignore") as log_file:
+        log_file.seek(0, os.SEEK_END)
+        start = max(log_file.tell() - max_bytes, 0)
+        log_file.seek(start, os.SEEK_SET)
+        lines = log_file.readlines()[1 if start else 0 :]  # the first line is cut off when we don't start at 0
+
+    entries = []
+    for line in lines:
+        line = line.encode("ascii", "ignore").decode()  # remove all non ASCII characters
+        if line.startswith("{"):
+            try:
+                entry = json.loads(line)
+                text = f"{entry['time']} - {entry['logger']} - {entry['level']} - {entry['message']}\n"
+                text += f"{entry['exc']}\n" if "exc" in entry else ""
+                entries.append({"level": entry["level"], "logger": entry["logger"], "text": text})
+                continue
+            except (ValueError, KeyError):
+                pass
+        match = LOG_LINE.match(line)
+        if match:
+            entries.append({"level": match["level"], "logger": match["logger"], "text": line})
+        elif entries:
+            entries[-1]["text"] += line  # continuation of a multi line message
+    return list(reversed(entries))
+
+
 @app.route("/api/logs")
 def get_logs():
+    """Optional filters: level (minimum, e.g. WARNING), logger (substring of the logger name), q (text search)"""
     try:
-        LOG_FILE_PATH = os.path.join(CONFIG_PATH, "log", "for_webviewer.log")
-        with open(LOG_FILE_PATH, "r") as log_file:
-            log_file.seek(0, os.SEEK_END)
-            log_size = log_file.tell()
-            log_file.seek(max(log_size - 50000, 0), os.SEEK_SET)
-
-            logs = log_file.readlines()
-            lines = [line.encode("ascii", "ignore").decode() for line in logs]  # remove all non ASCII characters
-            as_str = "".join(reversed(lines))
-
-        return jsonify({"logs": as_str})
+        min_level = logging.getLevelName(request.args.get("level", "DEBUG").upper())
+        min_level = min_level if isinstance(min_level, int) else logging.DEBUG
+        logger_filter = request.args.get("logger", "")
+        query = request.args.get("q", "").lower()
+        filtered = bool(logger_filter or query or min_level > logging.DEBUG)
+
+        entries = read_log_entries(500000 if filtered else 50000)  # look further back when filtering
+        entries = [
+            entry
+            for entry in entries
+            if logging.getLevelName(entry["level"]) >= min_level
+            and logger_filter in entry["logger"]
+            and query in entry["text"].lower()
+        ]
+        return jsonify({"logs": "".join(entry["text"] for entry in entries)})
     except Exception as e:
         logger.error(f"Error fetching logs: {e}")
         return jsonify({"error": "Error fetching logs"}), 500
 
 
+@app.route("/api/profile", methods=["POST"])
+def profile():
+    """Starts a capture in the manager (target=main, default) or in the webserver, see src/profiler.py"""
+    if not PROFILE_TOKEN:
+        return jsonify({"error": "Profiling is disabled, set PROFILE_TOKEN to enable it"}), 404
+    if not hmac.compare_digest(request.headers.get("X-Profile-Token", "").encode(), PROFILE_TOKEN.encode()):
+        return jsonify({"error": "Invalid profile token"}), 403
+
+    target = request.args.get("target", "main")
+    mode = request.args.get("mode", "sample")
+    try:
+        seconds = max(1, min(int(request.args.get("seconds", PROFILE_SECONDS)), MAX_PROFILE_SECONDS))
+    except ValueError:
+        return jsonify({"error": "seconds must be a whole number"}), 400
+    if target not in ["main", "webserver"] or mode not in MODES:
+        return jsonify({"error": f"target must be main or webserver, mode one of {MODES}"}), 400
+    if target == "webserver" and mode != "sample":
+        return jsonify({"error": "The webserver has no loop to cProfile, use mode=sample"}), 400
+
+    try:
+        if target == "main":
+            output = request_capture("main", mode, seconds)
+        else:
+            threading.Thread(target=profiler.start, args=(mode, seconds), name="profiler", daemon=True).start()
+            output = f"{CONFIG_PATH}/profiles/webserver-*"
+    except (OSError, ValueError) as e:
+        logger.error(f"Error starting the profiler: {e}")
+        return jsonify({"error": f"Could not reach the {target} process: {e}"}), 500
+    return jsonify({"status": "started", "target": target, "mode": mode, "seconds": seconds, "output": output})
+
+
 if __name__ == "__main__":
+    profiler.install()
     if app.config["DEBUG"]:
         app.run(host="0.0.0.0", port=5000, debug=True, use_reloader=True)
     else: